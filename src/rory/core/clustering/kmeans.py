@@ -1,5 +1,6 @@
 from time import time
 from utils.Utils import Utils
+from utils.constants import Constants
 from sklearn.cluster import KMeans
 from interfaces.clustering_result import ClusteringResult
 
@@ -10,7 +11,12 @@ def kmeans(**kwargs):
     startTime          = time()
     k                  = kwargs.get("k",2)
     plain_matrix       = kwargs.get("plaintext_matrix")
-    centroids          = Utils.generate_centroids(k = k,plain_matrix = plain_matrix) #generate initial centroid set
+    centroids          = Utils.generate_centroids( #generate initial centroid set
+        k            = k,
+        plain_matrix = plain_matrix,
+        seeding      = kwargs.get("seeding",Constants.Seeding.FIRST),
+        seed         = kwargs.get("seed")
+    )
     start_service_time = time()
     kmeans             = KMeans( #uses kmeans algorithm
         n_clusters = k,
@@ -3,6 +3,7 @@ import numpy as np
 from security.cryptosystem.liu import Liu
 from utils.constants import Constants
 from utils.Utils import Utils
+from utils.condensedmatrix import CondensedMatrix
 from security.cryptosystem.FDHOpe import Fdhope
 
 
@@ -16,36 +17,51 @@ class DBSKMeans(object):
 	"""
 	Description:
 		The skmeans algorithm is started up to where the decryption of the matrix S is required
+		With seeding (Constants.Seeding) the START call picks the seed records and returns their record order,
+		the caller passes it back to every later run1 and to the run_2 calls, which work on the records in that
+		order (run_2 rebuilds the seeded UDM from the outsourced one). The label vectors are in the original order.
+		The worker keeps no state between the calls.
+	return: (S1, Cent_i, Cent_j, label_vector, order), order is None for FIRST
 	"""
 	def run1(self,**kwargs):
 		try:
 			status  = kwargs.get("status",Constants.ClusteringStatus.START)
 			k       = kwargs.get("k",3)
 			m       = kwargs.get("m",3)
-			D1     = kwargs.get("encryptedMatrix")
+			dtype   = kwargs.get("dtype",np.float64)
+			D1      = np.asarray(kwargs.get("encryptedMatrix"),dtype=dtype)
 			D1Shape = Utils.getShapeOfMatrix(D1)
 			#D1      = _D1.tolist()
-			U      = kwargs.get("UDM")
+			U       = Utils.asMatrix(kwargs.get("UDM"),dtype) #dense or CondensedMatrix
 			#U       = _U.tolist()
 			a       = kwargs.get("num_attributes",D1Shape[1])
-			C_empty = Utils.empty_cluster(k = k)
+			order   = kwargs.get("order") #record order of a seeded run (returned by the START call), None for FIRST
+			if( status == Constants.ClusteringStatus.START ): #seed records first
+				order, U = Utils.seedPermutation(
+					UDM        = U,
+					k          = k,
+					attributes = a,
+					seeding    = kwargs.get("seeding",Constants.Seeding.FIRST),
+					seed       = kwargs.get("seed")
+				)
+			if(order is not None):
+				D1 = D1[order]
 			
 			# Cuando va iniciando DBSKMeans 
 			if( status == Constants.ClusteringStatus.START ):
-				C              = list(map(lambda x:[D1[x].tolist()],list(range(0,k)))) #add the first k records of D to C
 				C,label_vector = Utils.populateClusters(
 					record_id         = k,
 					UDM               = U,
-					clusters          = C,
-					ciphertext_matrix = D1,
+					k                 = k,
 				)
 				Cent_i = [D1[i] for i in range(k)] # initializes the set of centroids with the first record in D
 				Cent_j = Utils.calculateCentroids(
-					clusters   = C,
-					k          = k,
-					attributes = a,
-					m          = m,
-					Liu        = Liu
+					ciphertext_matrix = D1,
+					label_vector      = Utils.fillLabelVector(label_vector = label_vector, k = k),
+					k                 = k,
+					attributes        = a,
+					m                 = m,
+					Liu               = Liu
 				)
 				S1  = self.generateShifMatrix(
 					k = k,
@@ -54,27 +70,26 @@ class DBSKMeans(object):
 					previous_centroids = Cent_i, 
 					current_centroids  = Cent_j
 				)
-				self.label_vector = Utils.fillLabelVector(
-					label_vector = label_vector,
-					k            = k
+				self.label_vector = Utils.restoreOrder( #labels in the original record order
+					label_vector = Utils.fillLabelVector(label_vector = label_vector, k = k),
+					order        = order
 				)
-				return S1,Cent_i,Cent_j,self.label_vector
+				return S1,Cent_i,Cent_j,self.label_vector,order
 			else:
 				Cent_j  = kwargs.get("Cent_j") 
 				C, label_vector =  Utils.populateClusters(
 					record_id = 0,
 					UDM       = U,
-					clusters  = C_empty,
-					ciphertext_matrix = D1,
-					centroids = Cent_j,
+					k         = k,
 				)
 				Cent_i = copy.copy(Cent_j) #Reasigna los elementos de cent_j a cent_i
 				_Cent_j = Utils.calculateCentroids(
-					clusters   = C,
-					k          = k,
-					attributes = a,
-					m          = m,
-					Liu        = Liu
+					ciphertext_matrix = D1,
+					label_vector      = label_vector,
+					k                 = k,
+					attributes        = a,
+					m                 = m,
+					Liu               = Liu
 				)
 				S1     = self.generateShifMatrix(
 					k = k,
@@ -83,7 +98,7 @@ class DBSKMeans(object):
 					previous_centroids = Cent_i,
 					current_centroids  = _Cent_j,
 				)
-				return  S1,Cent_i,Cent_j,label_vector
+				return  S1,Cent_i,_Cent_j,Utils.restoreOrder(label_vector = label_vector, order = order),order
 		except Exception as e:
 			print(e)
 			raise e
@@ -93,32 +108,52 @@ class DBSKMeans(object):
 	description:  Update UDM matrix.
 		A UDM matrix is a 3D matrix containing distances between the attribute values in each record
 		and the corresponding attribute values in all other records.
+		The first update (initial) builds the n x k x a U1 from the outsourced UDM, the next ones add S to the
+		U1 of the previous run_2. That U1 is copied first, unless it is passed as out too.
 	attributes:
-		U: Updatable distance matrix
-		Cent_i: previous set of centroids
-		Cent_j: next set of centroids
-		m: number of attributes of SK
+		UDM: outsourced UDM (initial) or the U1 of the previous run_2
+		initial: required, True for the first update of a run, False afterwards
+		shiftMatrix: FDH-OPE encrypted shift matrix (k x a). FDH-OPE is only approximately additive, the caller
+			sums the plaintext shifts and passes E(S_1 + ... + S_j) - E(S_1 + ... + S_(j-1)), like Dbskmeans
+		order: record order returned by the START run1 (seeding), the first update seeds the outsourced UDM with it
+		k: number of clusters
+		attributes: number of attributes of U used
+		out: n x k x a array U1 is written into (optional), pass the UDM itself to update it in place
+		tile_size: rows of U read at once
+	return: U1
 	"""
 	def run_2(self,**kwargs):
-		status = kwargs.get("status",1)
-		k      = kwargs.get("k",3)
-		_U     = kwargs.get("UDM")
-		U      = _U.tolist()
-		a      = kwargs.get("attributes")
-		_S     = kwargs.get("shiftMatrix")
-		S      = _S.tolist()
-		U1 = []
-		for x in range(len(U)):
-			U1.append([])
-			for y in range(k):
-				U1[x].append([])
-				for z in range(a):
-					U1[x][y].append([])
-					if y > x: #Se revisa U completa.
-						U1[x][y][z] = ((-U[y][x][z] + S[y][z])) #Suma de cada elemento de U con S
-					else:
-						U1[x][y][z] = (U[x][y][z] + S[y][z]) #Suma de cada elemento de U con S
-		return U1
+		if("initial" not in kwargs): #the default used to fold the head again in every update
+			raise ValueError("run_2 needs initial: True for the first update of the outsourced UDM, False for the U1 of the previous run_2")
+		initial   = kwargs.get("initial")
+		k         = kwargs.get("k",3)
+		_U        = kwargs.get("UDM")
+		U         = _U if(isinstance(_U,CondensedMatrix)) else np.asarray(_U) #no copy, a .npy memmap is read tile by tile
+		a         = kwargs.get("attributes")
+		S         = kwargs.get("shiftMatrix")
+		dtype     = kwargs.get("dtype",np.float64)
+		tile_size = kwargs.get("tile_size",1024)
+		out       = kwargs.get("out")
+		if(initial):
+			U = Utils.seededUDM(UDM = U, order = kwargs.get("order"), k = k)
+		else:
+			if(isinstance(U,CondensedMatrix) or U.ndim != 3 or U.shape[1] != k):
+				raise ValueError("initial=False needs the n x k x a U1 of the previous run_2, got a UDM of shape {}".format(Utils.getShapeOfMatrix(U)))
+			if(out is None):
+				out = np.array(U) #the U1 of the caller is not modified
+			elif(not np.may_share_memory(out,U)):
+				np.copyto(out,U)
+			U = out
+		return Utils.shiftUDM(
+			UDM          = U,
+			shift_matrix = S,
+			k            = k,
+			attributes   = a,
+			dtype        = dtype,
+			initial      = initial,
+			out          = out,
+			tile_size    = tile_size,
+		)
 
 
 	"""
@@ -2,6 +2,7 @@ import numpy as np
 import copy
 from time import time
 from utils.Utils import Utils
+from utils.constants import Constants
 from security.cryptosystem.liu import Liu
 from security.cryptosystem.FDHOpe import Fdhope
 from logger.Dumblogger import DumbLogger
@@ -18,40 +19,60 @@ Attributes:
 	m: Number of attributes of SK
 	messageIntervals: Message space range
 	cypherIntervals: Ciphertext space range
+	dtype: storage dtype of D1 and U, np.float64 (default) or np.float32
+	tile_size: rows of U read at once, U can be an out-of-core .npy memmap (DataOwner udm_path)
+	seeding: Constants.Seeding strategy of the initial centroids (default FIRST, the first k records), seed: its random seed
+	order: record order of a seeded run (Utils.seedPermutation), None for FIRST
 Variables:
-	C: Set of clusters
+	C: Set of clusters, the record indexes of every cluster (Utils.populateClusters)
+	shift: plaintext sum of the shift matrices, its FDH-OPE encryption is what U1 adds to the EUDM
 """
 class Dbskmeans(object):
 
 	def __init__(self,**kwargs):
-		self.D1               = kwargs.get("ciphertext_matrix")
-		self.U                = kwargs.get("UDM")
+		self.dtype            = kwargs.get("dtype",np.float64)
+		self.tile_size        = kwargs.get("tile_size",1024)
+		self.U1               = None #n x k x a buffer of the updated EUDM, allocated in the first update
+		self.shift            = None #plaintext sum of the shift matrices of every update (Cent_0 - Cent_j)
+		self.encryptedShift   = None #FDH-OPE encryption of self.shift already added to U1
+		self.D1               = np.asarray(kwargs.get("ciphertext_matrix"),dtype=self.dtype)
+		self.magnitude        = 2 * np.abs(self.D1).max(axis=(0,1)) if(np.dtype(self.dtype) == np.float32 and self.D1.size > 0) else None #|E| bound of S1 = Cent_i - Cent_j
+		self.U                = Utils.asMatrix(kwargs.get("UDM"),self.dtype) #dense or CondensedMatrix
 		self.k                = kwargs.get("k",2)
 		D1Shape               = Utils.getShapeOfMatrix(self.D1)
 		self.a                = kwargs.get("num_attributes",D1Shape[1])
 		self.m                = kwargs.get("m",3)
+		self.order, self.U    = Utils.seedPermutation( #seed records first (None and U itself for the first k records)
+			UDM        = self.U,
+			k          = self.k,
+			attributes = self.a,
+			seeding    = kwargs.get("seeding",Constants.Seeding.FIRST),
+			seed       = kwargs.get("seed")
+		)
+		if(self.order is not None): #the algorithm runs on the records in seeded order
+			self.D1 = self.D1[self.order]
 		self.dataowner        = kwargs.get("dataowner") 
 		self.messageIntervals = kwargs.get("messageIntervals") 
 		self.cypherIntervals  = kwargs.get("cypherIntervals")
 		self.sens             = kwargs.get("sens",0.01)
 		self.max_iterations   = kwargs.get("max_iterations",100) #maximum number of possible iterations until it stops
 		self.L                = kwargs.get("logger",DumbLogger()) #only for DEBUGGING purposes. 
-		self.C                = list(map(lambda x:[self.D1[x].tolist()],list(range(0,self.k)))) #add the first k records of D to C
 		self.Cent_i           = [self.D1[i] for i in range(self.k)] # initializes the set of centroids with the first record in D
 		__C, label_vector     = Utils.populateClusters( #new set of C and label vector initial
             record_id         = self.k,
             UDM               = self.U,
-            clusters          = self.C,
-            ciphertext_matrix = self.D1,
+            k                 = self.k,
+            tile_size         = self.tile_size,
 		)
 		#print("self.U",self.U.tolist())
 		self.C      = __C
 		self.Cent_j = Utils.calculateCentroids( #centroids are recalculated
-			clusters   = self.C,
-			k          = self.k,
-			attributes = self.a,
-			m          = self.m,
-			Liu        = Liu
+			ciphertext_matrix = self.D1,
+			label_vector      = Utils.fillLabelVector(label_vector = label_vector, k = self.k),
+			k                 = self.k,
+			attributes        = self.a,
+			m                 = self.m,
+			Liu               = Liu
 		)
 		U, terminate = self.updateEncryptedUDM( #update matrix U and shift matrix
 			UDM                 = self.U,
@@ -74,24 +95,23 @@ class Dbskmeans(object):
 
 		while not self.terminate: #stops when shift matrix (S) is 0
 			self.L.debug("SKMEANS[{}]".format(self.iteration_counter)) #save iteration counter in log
-			C_empty           = Utils.empty_cluster(k = self.k) #restart C to place the new clusters
 			__C, label_vector = Utils.populateClusters( #new set of C and new labeled vector
                 record_id         = 0,
 				UDM               = self.U,
-				clusters          = C_empty,
-				ciphertext_matrix = self.D1,
-				centroids         = self.Cent_j,
+				k                 = self.k,
+				tile_size         = self.tile_size,
 			)
 			C      = __C
 			self.C = C 
 			Cent_i = copy.copy(self.Cent_j) #reassign the elements of cent_j to cent_i
 			self.L.debug("SKMEANS[{}] CALCULATE_CENTROIDS".format(self.iteration_counter)) #save iteration counter in log
 			self.Cent_j = Utils.calculateCentroids( #centroids are recalculated
-				clusters   = self.C,
-				k          = self.k,
-				attributes = self.a,
-				m          = self.m,
-				Liu        = Liu
+				ciphertext_matrix = self.D1,
+				label_vector      = label_vector,
+				k                 = self.k,
+				attributes        = self.a,
+				m                 = self.m,
+				Liu               = Liu
 			)
 			self.L.debug("SKMEANS[{}] UPDATE_UDM".format(self.iteration_counter)) #save iteration counter in log
 			U, terminate = self.updateEncryptedUDM( #update U and shift matrix
@@ -105,14 +125,17 @@ class Dbskmeans(object):
 			self.label_vector = label_vector
 			self.iteration_counter += 1 #increase number of iterations
 			if(self.iteration_counter >= self.max_iterations): #if the iterations reach the maximum it stops
-				temp = True
+				self.terminate = True
+		self.label_vector = Utils.restoreOrder(label_vector = self.label_vector, order = self.order) #labels in the original record order
 		return ClusteringResult(
         	label_vector = self.label_vector
    		)
 	
 	
 	"""
-	description:  Update encrypted UDM matrix.
+	description:  Update encrypted UDM matrix. FDH-OPE is only approximately additive, so the shift
+		matrices are summed in the plaintext domain and U1 always holds EU + E(S_1 + ... + S_j):
+		every update adds E(S_1 + ... + S_j) - E(S_1 + ... + S_(j-1)) and the error does not build up.
 	attributes:
 		EU: Encrypted updatable distance matrix
 		Cent_i: previous set of centroids
@@ -121,7 +144,6 @@ class Dbskmeans(object):
 	"""
 	def updateEncryptedUDM(self, **kwargs): #Proceso de actualizacion de la matriz EU
 		UDM    = kwargs.get("UDM")
-		UShape = Utils.getShapeOfMatrix(UDM)
 		Cent_i = kwargs.get("previuous_centroids")
 		Cent_j = kwargs.get("current_centroids")
 		S1     = np.zeros((self.k,self.a,self.m)).tolist() #Fill S with 0
@@ -131,26 +153,28 @@ class Dbskmeans(object):
 				S1[i][j] = Liu.subtract(ciphertext_1 = Cent_i[i][j], ciphertext_2 = Cent_j[i][j]) #subtract with Liu's scheme
 		S = self.dataowner.userActions( #decryption by data owner #S -> 2D matrix
 			shift_matrix = S1,
-			m            = self.m
+			m            = self.m,
+			dtype        = self.dtype,
+			magnitude    = self.magnitude
+		)
+		S            = np.asarray(S,dtype=np.float64)
+		self.shift   = S if(self.shift is None) else self.shift + S #the shifts are folded before the encryption
+		encrypted    = Fdhope.encrypt_array( #Encrypt every element of the folded shift with the FDHOPE scheme
+			plaintext_matrix = self.shift, 
+			sens             = self.sens, 
+			messagespace     = self.messageIntervals, 
+			cipherspace      = self.cypherIntervals
+		)
+		S1 = encrypted if(self.encryptedShift is None) else encrypted - self.encryptedShift
+		self.encryptedShift = encrypted
+		self.U1 = Utils.shiftUDM( #the EUDM is built in the first update, then S1 is added in place
+			UDM          = UDM,
+			shift_matrix = S1,
+			k            = self.k,
+			attributes   = self.a,
+			dtype        = self.dtype,
+			initial      = self.U1 is None, #afterwards U is the U1 of the previous update
+			tile_size    = self.tile_size,
 		)
-		for x in range(len(S)): 
-			for y in range(len(S[0])):
-				S1[x][y] = Fdhope.encrypt( #Encrypt each element of S1 with the FDHOPE scheme
-					plaintext    = S[x][y], 
-					sens         = self.sens, 
-					messagespace = self.messageIntervals, 
-					cipherspace  = self.cypherIntervals
-				)
-		EUDM = []
-		for x in range(UShape[0]): # construction of U1
-			EUDM.append([]) #first dimension of U
-			for y in range(self.k):
-				EUDM[x].append([]) #second dimension of U
-				for z in range(self.a):
-					EUDM[x][y].append([]) #third dimension of U
-					if y > x: #complete U is reviewed.
-						EUDM[x][y][z] = ((-UDM[y][x][z] + S1[y][z])) #sum of each element of U with S
-					else:
-						EUDM[x][y][z] = (UDM[x][y][z] + S1[y][z]) #sum of each element of U with S
 		terminate = Utils.verifyZero(S) #Check that matrix is 0
-		return np.array(EUDM), terminate
\ No newline at end of file
+		return self.U1, terminate
\ No newline at end of file
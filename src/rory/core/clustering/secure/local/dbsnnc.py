@@ -22,12 +22,18 @@ class Dbsnnc(object):
 		EDshape            = Utils.getShapeOfMatrix(ED)
 		start_service_time = time()
 		c_indexes          = [[0]] #index of the first record in D
+		tiles              = Utils.iterRowTiles( #ED is read tile by tile (ED can be a memmap)
+			matrix    = ED,
+			start     = 1,
+			stop      = EDshape[0],
+			tile_size = kwargs.get("tile_size",1024)
+		)
 
-		for record_index in range(1,EDshape[0]): #iterate through the records in D
+		for record_index,ED_row in ((x,row) for start,stop,tile in tiles for x,row in zip(range(start,stop),tile)): #iterate through the records in D
 			for cluster_index, index_cluster in enumerate(c_indexes): #iterate the indexes of the clusters
 				record_distances = [] #distances of a record with respect to all the elements of the cluster
 				for record_index_cluster in index_cluster: # iterate through the list of cluster indexes
-					edi = ED[record_index][record_index_cluster] #locate the record in ED with respect to the cluster
+					edi = ED_row[record_index_cluster] #locate the record in ED with respect to the cluster
 					record_distances.append(edi) #distance of a record with respect to the record of a cluster
 				min_distance_index = np.argmin(record_distances) #index of the record with the smallest distance from the other records in the cluster
 				min_distance = record_distances[min_distance_index] #record with least distance
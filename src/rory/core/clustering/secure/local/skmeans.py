@@ -1,6 +1,8 @@
 import numpy as np
 import copy
 from utils.Utils import Utils
+from utils.constants import Constants
+from utils.assignmentbounds import AssignmentBounds
 from security.cryptosystem.liu import Liu
 from logger.Dumblogger import DumbLogger
 from interfaces.clustering_result import ClusteringResult
@@ -14,36 +16,55 @@ Attributes:
 	k: Number of clusters
 	a: Number of attributes of D1
 	m: number of attributes of SK
+	dtype: storage dtype of D1 and U, np.float64 (default) or np.float32
+	tile_size: rows of U read at once, U can be an out-of-core .npy memmap (DataOwner udm_path)
+	seeding: Constants.Seeding strategy of the initial centroids (default FIRST, the first k records), seed: its random seed
+	order: record order of a seeded run (Utils.seedPermutation), None for FIRST
+	pruning: reassign only the records whose distance bounds do not prove their label (AssignmentBounds), same labels
 Variables:
-	C: Set of clusters
+	C: Set of clusters, the record indexes of every cluster (Utils.populateClusters)
 """
 class SKMeans(object):
 
 	def __init__(self,**kwargs):
-		self.D1             = kwargs.get("ciphertext_matrix")
-		self.U              = kwargs.get("UDM")
+		self.dtype          = kwargs.get("dtype",np.float64)
+		self.tile_size      = kwargs.get("tile_size",1024)
+		self.U1             = None #n x k x a buffer of the updated UDM, allocated in the first update
+		self.D1             = np.asarray(kwargs.get("ciphertext_matrix"),dtype=self.dtype)
+		self.magnitude      = 2 * np.abs(self.D1).max(axis=(0,1)) if(np.dtype(self.dtype) == np.float32 and self.D1.size > 0) else None #|E| bound of S1 = Cent_i - Cent_j
+		self.U              = Utils.asMatrix(kwargs.get("UDM"),self.dtype) #dense or CondensedMatrix
 		self.k              = kwargs.get("k",2)
 		D1Shape             = Utils.getShapeOfMatrix(self.D1)
 		self.a              = kwargs.get("num_attributes",D1Shape[1])
 		self.m              = kwargs.get("m",3)
+		self.order, self.U  = Utils.seedPermutation( #seed records first (None and U itself for the first k records)
+			UDM        = self.U,
+			k          = self.k,
+			attributes = self.a,
+			seeding    = kwargs.get("seeding",Constants.Seeding.FIRST),
+			seed       = kwargs.get("seed")
+		)
+		if(self.order is not None): #the algorithm runs on the records in seeded order
+			self.D1 = self.D1[self.order]
 		self.dataowner      = kwargs.get("dataowner") 
 		self.max_iterations = kwargs.get("max_iterations",100) #maximum number of possible iterations until it stops
 		self.L              = kwargs.get("logger",DumbLogger()) #only for DEBUGGING purposes. 
-		self.C              = list(map(lambda x:[self.D1[x].tolist()],list(range(0,self.k)))) #add the first k records of D to C
+		self.bounds         = AssignmentBounds(k = self.k, attributes = self.a, tile_size = self.tile_size) if(kwargs.get("pruning",False)) else None
 		self.Cent_i         = [self.D1[i] for i in range(self.k)] # initializes the set of centroids with the first record in D
 		__C, label_vector   = Utils.populateClusters( #new set of C and label vector initial
             record_id         = self.k,
             UDM               = self.U,
-            clusters          = self.C,
-            ciphertext_matrix = self.D1,
+            k                 = self.k,
+            tile_size         = self.tile_size,
 		)
 		self.C      = __C
 		self.Cent_j = Utils.calculateCentroids( #centroids are recalculated
-			clusters   = self.C,
-			k          = self.k,
-			attributes = self.a,
-			m          = self.m,
-			Liu        = Liu
+			ciphertext_matrix = self.D1,
+			label_vector      = Utils.fillLabelVector(label_vector = label_vector, k = self.k),
+			k                 = self.k,
+			attributes        = self.a,
+			m                 = self.m,
+			Liu               = Liu
 		)
 		U, S = self.updateUDM( #update matrix U and shift matrix
 			UDM                 = self.U,
@@ -67,24 +88,28 @@ class SKMeans(object):
 
 		while not temp: #stops when shift matrix (S) is 0
 			self.L.debug("SKMEANS[{}]".format(self.iteration_counter)) #save iteration counter in log
-			C_empty           = Utils.empty_cluster(k = self.k) #restart C to place the new clusters
+			labels            = None
+			if(self.bounds is not None): #the bounds follow the shift matrix added to U since the previous iteration
+				labels = self.bounds.assign(UDM = self.U, shift_matrix = None if(self.iteration_counter == 0) else self.S)
+				self.L.debug("SKMEANS[{}] REASSIGNED={}".format(self.iteration_counter,self.bounds.recomputed))
 			__C, label_vector = Utils.populateClusters( #new set of C and new labeled vector
                 record_id         = 0,
 				UDM               = self.U,
-				clusters          = C_empty,
-				ciphertext_matrix = self.D1,
-				centroids         = self.Cent_j,
+				k                 = self.k,
+				tile_size         = self.tile_size,
+				label_vector      = labels,
 			)
 			C      = __C
 			self.C = C 
 			Cent_i = copy.copy(self.Cent_j) #reassign the elements of cent_j to cent_i
 			self.L.debug("SKMEANS[{}] CALCULATE_CENTROIDS".format(self.iteration_counter)) #save iteration counter in log
 			self.Cent_j = Utils.calculateCentroids( #centroids are recalculated
-				clusters   = self.C,
-				k          = self.k,
-				attributes = self.a,
-				m          = self.m,
-				Liu        = Liu
+				ciphertext_matrix = self.D1,
+				label_vector      = label_vector,
+				k                 = self.k,
+				attributes        = self.a,
+				m                 = self.m,
+				Liu               = Liu
 			)
 			self.L.debug("SKMEANS[{}] UPDATE_UDM".format(self.iteration_counter)) #save iteration counter in log
 			U, S = self.updateUDM( #update U and shift matrix
@@ -93,12 +118,14 @@ class SKMeans(object):
 				current_centroids   = self.Cent_j, 
 			)
 			self.U = U
+			self.S = S
 			temp   = Utils.verifyZero(S) #boolean variable that checks if Shift matrix had changes
 			self.L.debug("SKMEANS[{}] VERIFY_ZERO={}".format(self.iteration_counter,temp)) #save iteration counter and temp in log
 			self.label_vector = label_vector
 			self.iteration_counter += 1 #increase number of iterations
 			if(self.iteration_counter >= self.max_iterations): #if the iterations reach the maximum it stops
 				temp = True
+		self.label_vector = Utils.restoreOrder(label_vector = self.label_vector, order = self.order) #labels in the original record order
 		return ClusteringResult(
         	label_vector = self.label_vector
    		)
@@ -123,20 +150,20 @@ class SKMeans(object):
 				S1[i][j] = Liu.subtract(ciphertext_1 = Cent_i[i][j], ciphertext_2 = Cent_j[i][j]) #subtract with Liu's scheme
 		S = self.dataowner.userActions( #decryption by data owner #S -> 2D matrix
 			shift_matrix = S1,
-			m            = self.m
+			m            = self.m,
+			dtype        = self.dtype,
+			magnitude    = self.magnitude
+		)
+		self.U1 = Utils.shiftUDM( #U1 is built in the first update, then S is added in place
+			UDM          = U,
+			shift_matrix = S,
+			k            = self.k,
+			attributes   = self.a,
+			dtype        = self.dtype,
+			initial      = self.U1 is None, #afterwards U is the U1 of the previous update
+			tile_size    = self.tile_size,
 		)
-		U1 = []
-		for x in range(len(U)): # construction of U1
-			U1.append([]) #first dimension of U
-			for y in range(self.k):
-				U1[x].append([]) #second dimension of U
-				for z in range(self.a):
-					U1[x][y].append([]) #third dimension of U
-					if y > x: #complete U is reviewed.
-						U1[x][y][z] = ((-U[y][x][z] + S[y][z])) #sum of each element of U with S
-					else:
-						U1[x][y][z] = (U[x][y][z] + S[y][z]) #sum of each element of U with S
-		return U1,S
+		return self.U1,S
 
 if __name__ == "__main__":
 	D = np.load("D:/scs/testing/SKMEANS_matrix.npy")
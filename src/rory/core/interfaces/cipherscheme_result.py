@@ -8,6 +8,7 @@ class CipherschemeResult(object):
 		self.matrix         = kwargs.get("matrix",np.array([]))
 		self.time           = kwargs.get("time",0)
 		self.operation_type = kwargs.get("operation_type","encrypt")
+		self.round          = kwargs.get("round",False) #rounding mode to decrypt an encrypted batch
 	
 	def __str__(self):
 		return "MatrixStats({}s)".format(self.time)
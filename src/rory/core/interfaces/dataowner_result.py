@@ -11,4 +11,7 @@ class DataownerResult(object):
 		self.encrypted_matrix_time = kwargs.get("encrypted_matrix_time",np.array([]))
 		self.messageIntervals      = kwargs.get("messageIntervals",{})
 		self.cypherIntervals       = kwargs.get("cypherIntervals",{})
-		self.encrypted_threshold   = kwargs.get("encrypted_threshold",0)
\ No newline at end of file
+		self.encrypted_threshold   = kwargs.get("encrypted_threshold",0)
+		self.stage_times           = kwargs.get("stage_times",{}) #seconds per stage: encryption, udm, keygen, fdhope
+		self.critical_path_time    = kwargs.get("critical_path_time",0) #longest chain of dependent stages
+		self.total_time            = kwargs.get("total_time",0) #wall time, close to critical_path_time when pipelined
\ No newline at end of file
@@ -0,0 +1,21 @@
+import numpy as np
+
+"""
+Description: Interface used for the records appended to an outsourced dataset (DataOwner.append_records),
+	merged by the workers into the stored UDM/EDM and ciphertext matrix with Utils.mergeDelta
+Attributes:
+	start: number of records already outsourced, the new records are start..start+p-1
+	encrypted_matrix: ciphertexts of the new records (p x a x m)
+	udm_rows: new rows of the UDM/EDM (p x N [x a], N = start + p), or the new entries of the condensed lower triangle
+	udm_columns: new columns of the stored rows (start x p [x a]), None for a KCOLUMNS or condensed UDM/EDM
+	condensed: udm_rows holds condensed entries
+"""
+class OutsourcingDelta(object):
+	def __init__(self,**kwargs):
+		self.start                 = kwargs.get("start",0)
+		self.encrypted_matrix      = kwargs.get("encrypted_matrix",np.array([]))
+		self.encrypted_matrix_time = kwargs.get("encrypted_matrix_time",0)
+		self.udm_rows              = kwargs.get("udm_rows",np.array([]))
+		self.udm_columns           = kwargs.get("udm_columns")
+		self.udm_time              = kwargs.get("udm_time",0)
+		self.condensed             = kwargs.get("condensed",False)
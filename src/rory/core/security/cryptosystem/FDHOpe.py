@@ -0,0 +1,131 @@
+import numpy as np
+from utils.condensedmatrix import CondensedMatrix
+from logger.Dumblogger import DumbLogger
+from security.cryptosystem.fdhopesketch import FdhopeSketch
+
+"""
+Description:
+	Frequency and Distribution Hiding Order Preserving Encryption (FDH-OPE).
+	The secret key is a pair of sorted boundary arrays: the message space [0, M[-1]] is split
+	at the (sketched) quantiles of the data, so every message interval holds the same number of values,
+	and each message interval [M[i], M[i+1]) is mapped linearly onto the cipher interval
+	[C[i], C[i+1]) of random length. The ciphertexts are therefore close to uniformly
+	distributed whatever the distribution of the plaintexts.
+	The map is not linear, E(u) + E(s) = E(u + s) only holds approximately (the slopes of two
+	intervals differ by at most a factor 3). Dbskmeans adds the encrypted shift matrix to the
+	encrypted UDM, so it folds the shifts in the plaintext domain and encrypts their running sum,
+	the approximation error stays bounded and does not build up over the iterations.
+	The map is applied to |v| and the sign is kept, E(-v) = -E(v) and E(0) = 0, so the
+	antisymmetry of the UDM and the zero diagonal of the EDM survive the encryption.
+Attributes:
+	messageIntervals: sorted boundaries of the message intervals, messageIntervals[0] = 0
+	cypherIntervals: sorted boundaries of the cipher intervals, cypherIntervals[0] = 0
+	sens: sensitivity of the plaintexts, values closer than sens may not keep their order
+Notes:
+	Values beyond the last boundary are extrapolated with the slope of the last interval.
+"""
+class Fdhope(object):
+
+	"""
+	description: Generates the message and cipher intervals (secret key). The message boundaries are
+		the quantiles of a bounded histogram (FdhopeSketch): either a sketch filled while the UDM/EDM
+		was built, or one filled here by streaming the dataset in blocks of block_size rows, so the
+		memory used does not depend on the number of values.
+	attributes:
+		dataset: values to encrypt (list, ndarray, .npy memmap or CondensedMatrix)
+		sketch: FdhopeSketch already filled with the values (replaces dataset)
+		block_size: rows of dataset added to the sketch at once (default 256)
+		bins: bins of the sketch (default 4096)
+		intervals: number of intervals (default 32)
+		expansion: ratio between the cipher and the message space (default 10)
+		seed: seed of the random cipher interval lengths
+	return: (messageIntervals, cypherIntervals)
+	"""
+	def keygen(**kwargs):
+		intervals = max(1,kwargs.get("intervals",32))
+		expansion = kwargs.get("expansion",10)
+		rng       = np.random.default_rng(kwargs.get("seed"))
+		logger    = kwargs.get("logger",DumbLogger())
+		sketch    = kwargs.get("sketch")
+		if(sketch is None):
+			sketch = Fdhope.sketch(**kwargs)
+		if(sketch.count == 0):
+			messageIntervals = np.array([0.0,1.0])
+		else:
+			quantiles        = sketch.quantile(np.linspace(0,1,intervals + 1)[1:])
+			messageIntervals = np.unique(np.concatenate(([0.0],quantiles))) #equal-frequency intervals
+			if(len(messageIntervals) == 1): #every value is 0
+				messageIntervals = np.array([0.0,1.0])
+		unit            = messageIntervals[-1] * expansion / (len(messageIntervals) - 1)
+		lengths         = unit * rng.uniform(0.5,1.5,len(messageIntervals) - 1) #equal expected length hides the frequencies
+		cypherIntervals = np.concatenate(([0.0],np.cumsum(lengths)))
+		logger.debug("FDHOPE_KEYGEN INTERVALS={} MESSAGE_MAX={}".format(len(lengths),messageIntervals[-1]))
+		return messageIntervals, cypherIntervals
+
+	"""
+	description: Streams a dataset into a new FdhopeSketch, block_size rows at a time
+	attributes:
+		dataset: list, ndarray, .npy memmap or CondensedMatrix
+		block_size: rows added at once (default 256)
+		bins: bins of the sketch (default 4096)
+	"""
+	def sketch(**kwargs):
+		dataset    = kwargs.get("dataset")
+		block_size = max(1,kwargs.get("block_size",256))
+		sketch     = FdhopeSketch(bins = kwargs.get("bins",4096))
+		values     = dataset.data if(isinstance(dataset,CondensedMatrix)) else dataset #the condensed form already holds every distinct value
+		values     = values if(hasattr(values,"shape")) else np.asarray(values,dtype=np.float64)
+		if(values.ndim == 0):
+			return sketch.update(values)
+		for start in range(0,len(values),block_size):
+			sketch.update(values[start:start + block_size])
+		return sketch
+
+	"""
+	description: Encrypts a scalar, see encrypt_array
+	attributes:
+		plaintext: value to encrypt
+		sens: sensitivity of the plaintexts (default 0, deterministic encryption)
+		messagespace: message intervals of keygen
+		cipherspace: cipher intervals of keygen
+	"""
+	def encrypt(**kwargs):
+		kwargs["plaintext_matrix"] = kwargs.get("plaintext",0)
+		return float(Fdhope.encrypt_array(**kwargs))
+
+	"""
+	description: Encrypts a whole array. The interval of every value is located with
+		np.searchsorted and the linear map of its interval is applied as one array operation.
+	attributes:
+		plaintext_matrix: values to encrypt (any shape)
+		sens: sensitivity of the plaintexts, a uniform noise in [0, sens * slope) is added inside
+			the interval so equal plaintexts do not give equal ciphertexts (default 0, deterministic)
+		messagespace: message intervals of keygen
+		cipherspace: cipher intervals of keygen
+		seed | rng: source of the noise
+		out: preallocated output of the same shape (optional), it may be plaintext_matrix itself
+	return: ndarray with the ciphertexts
+	"""
+	def encrypt_array(**kwargs):
+		v    = np.asarray(kwargs.get("plaintext_matrix"),dtype=np.float64)
+		sens = kwargs.get("sens",0)
+		M    = np.asarray(kwargs.get("messagespace"),dtype=np.float64)
+		C    = np.asarray(kwargs.get("cipherspace"),dtype=np.float64)
+		out  = kwargs.get("out")
+		out  = np.empty(v.shape) if(out is None) else out
+		if(len(M) < 2 or len(M) != len(C)):
+			raise ValueError("The message and cipher spaces need the same number (>= 2) of boundaries, got {} and {}".format(len(M),len(C)))
+		slopes = np.diff(C) / np.diff(M)
+		av     = np.abs(v)
+		sign   = np.sign(v) #kept apart, out may overwrite v
+		index  = np.clip(np.searchsorted(M,av,side="right") - 1, 0, len(slopes) - 1) #values beyond M[-1] use the last interval
+		slope  = slopes[index]
+		E      = np.multiply(av - M[index], slope, out = out)
+		E     += C[index]
+		if(sens > 0):
+			rng    = kwargs.get("rng") or np.random.default_rng(kwargs.get("seed"))
+			E     += rng.uniform(0,sens,E.shape) * slope
+			upper  = np.where(av < M[-1], C[np.minimum(index + 1,len(C) - 1)], np.inf)
+			np.minimum(E, upper, out = E) #the noise never leaves the cipher interval
+		E *= sign #E(-v) = -E(v), E(0) = 0
+		return E
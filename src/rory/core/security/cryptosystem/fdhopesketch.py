@@ -0,0 +1,91 @@
+import numpy as np
+
+"""
+Description:
+	Bounded histogram of |v| used by Fdhope.keygen to derive the message intervals without
+	holding the UDM/EDM. Blocks of values are added with update as they are produced (or read);
+	the memory is bins counters whatever the number of values.
+	The histogram covers [0, upper) with bins equal-width bins. When a value reaches upper, the
+	range is doubled and adjacent bins are merged, so the counts are never lost.
+Attributes:
+	bins: number of bins (even, default 4096)
+	upper: upper bound of the range covered by the histogram (a power of two)
+	counts: counters of the bins
+	count: number of values added
+	maximum: largest |v| added
+"""
+class FdhopeSketch(object):
+	def __init__(self,**kwargs):
+		self.bins    = max(2,kwargs.get("bins",4096) // 2 * 2)
+		self.upper   = 0.0
+		self.counts  = np.zeros(self.bins,dtype=np.int64)
+		self.count   = 0
+		self.maximum = 0.0
+
+	"""
+	description: Doubles the range until it covers value, merging adjacent bins
+	"""
+	def __grow(self,value):
+		if(self.upper == 0):
+			self.upper = 2.0 ** np.ceil(np.log2(value)) if(value > 0) else 1.0
+		while(value >= self.upper):
+			half        = self.counts.reshape(-1,2).sum(axis = 1)
+			self.counts = np.concatenate((half,np.zeros(self.bins // 2,dtype=np.int64)))
+			self.upper *= 2
+
+	"""
+	description: Adds a block of values (any shape) to the histogram
+	"""
+	def update(self,block):
+		values = np.abs(np.asarray(block,dtype=np.float64)).ravel()
+		values = values[np.isfinite(values)]
+		if(values.size == 0):
+			return self
+		maximum = values.max()
+		self.__grow(maximum)
+		index         = np.minimum((values * (self.bins / self.upper)).astype(np.int64), self.bins - 1)
+		self.counts  += np.bincount(index, minlength = self.bins)
+		self.count   += values.size
+		self.maximum  = max(self.maximum,maximum)
+		return self
+
+	"""
+	description: Adds the counts of another sketch (e.g. built by another worker)
+	"""
+	def merge(self,other):
+		if(other.count == 0):
+			return self
+		if(other.bins != self.bins):
+			raise ValueError("Sketches with {} and {} bins can not be merged".format(self.bins,other.bins))
+		other = other.copy()
+		self.__grow(other.upper / 2)
+		other.__grow(self.upper / 2)
+		self.counts  += other.counts
+		self.count   += other.count
+		self.maximum  = max(self.maximum,other.maximum)
+		return self
+
+	def copy(self):
+		sketch         = FdhopeSketch(bins = self.bins)
+		sketch.upper   = self.upper
+		sketch.counts  = self.counts.copy()
+		sketch.count   = self.count
+		sketch.maximum = self.maximum
+		return sketch
+
+	"""
+	description: Approximate quantiles of |v|, linear interpolation inside the bins
+	attributes:
+		q: probabilities in [0, 1]
+	"""
+	def quantile(self,q):
+		q = np.asarray(q,dtype=np.float64)
+		if(self.count == 0):
+			return np.zeros(q.shape)
+		cdf   = np.concatenate(([0],np.cumsum(self.counts)))
+		edges = np.linspace(0,self.upper,self.bins + 1)
+		index = np.clip(np.searchsorted(cdf, q * self.count, side = "left"), 1, self.bins) #first bin whose cdf reaches the rank
+		low   = cdf[index - 1]
+		width = np.maximum(cdf[index] - low, 1)
+		value = edges[index - 1] + (q * self.count - low) / width * (edges[index] - edges[index - 1])
+		return np.minimum(value, self.maximum)
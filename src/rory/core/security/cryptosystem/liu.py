@@ -2,13 +2,61 @@ from http.cookiejar import LWPCookieJar
 import random
 import numpy as np
 from time import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
 from interfaces.cipherscheme_result import CipherschemeResult
 
+"""
+description: Process pool task of Liu.parallelEncryptMatrix. Attaches to the output buffer
+	(shared memory block or .npy memmap) and writes the ciphertexts of rows [start, stop) in place.
+attributes:
+	plaintext_matrix: rows of the chunk
+	secret_key: secret key
+	m: number of attributes of SK
+	seed: SeedSequence of the chunk
+	buffer: ("shm", name) | ("memmap", path)
+	shape: shape of the whole ciphertext tensor
+	dtype: dtype of the ciphertext tensor
+	start, stop: rows of the chunk
+"""
+def _encryptChunk(**kwargs):
+	kind,name = kwargs.get("buffer")
+	shape     = kwargs.get("shape")
+	start     = kwargs.get("start")
+	stop      = kwargs.get("stop")
+	dtype     = kwargs.get("dtype",np.float64)
+	shm       = None
+	if(kind == "shm"):
+		shm = shared_memory.SharedMemory(name = name)
+		out = np.ndarray(shape,dtype=dtype,buffer=shm.buf)
+	else:
+		out = np.load(name,mmap_mode="r+")
+	try:
+		Liu().encryptTensor(
+			plaintext_matrix = kwargs.get("plaintext_matrix"),
+			secret_key       = kwargs.get("secret_key"),
+			m                = kwargs.get("m"),
+			rng              = np.random.default_rng(kwargs.get("seed")),
+			out              = out[start:stop]
+		)
+		if(kind == "memmap"):
+			out.flush()
+	finally:
+		del out
+		if(shm is not None):
+			shm.close()
+	return stop - start
+
 """
 Description: 
 	class to represent a symmetric encryption scheme
 Attributes:
-    _round: Flag to know if decryption needs to be rounded based on plaintext type
+    round: Default rounding mode of the decryption, fixed at construction. 
+		Every decryption accepts an explicit round flag that overrides it.
+Notes:
+	Liu is stateless: encryption and decryption never write to the instance, the randomness
+	is drawn per call (or per batch through rng/R) and the rounding mode is explicit per call.
+	One Liu object, and one secret key, can be shared by many threads at once.
 """
 class Liu(object):
 	def __init__(self,**kwargs):
@@ -19,8 +67,7 @@ class Liu(object):
 	description: Generate a uniform distributed numbers [0,1]
 	"""
 	def generateRandom(self):
-		self.r = random.uniform(0,1)
-		return self.r
+		return random.uniform(0,1)
 
 
 	"""
@@ -34,33 +81,151 @@ class Liu(object):
     """
 	def secretKey(self, **kwargs): 
 		m       = kwargs.get("m",3)
-		self.sk = []
+		sk      = []
 		zero_tp = (0,0,0)
 		for i in range(m):
 			tp = self.generateRandom(),self.generateRandom(),self.generateRandom() # generate triplets
 			if(i==(m-1)): 
 				while(zero_tp == tp):
 					tp = self.generateRandom(), self.generateRandom(), self.generateRandom()
-			self.sk.append(tp)
-		return self.sk
+			sk.append(tp)
+		return sk
 
 
 	"""
-	description: split a plaintext matrix into vectors
+	description: Encrypt a plaintext matrix using the batch engine (see encryptTensor)
+	return: CipherschemeResult, its round flag is the rounding mode to use when decrypting this batch
     """
 	def encryptMatrix(self,**kwargs):
 		start_time = time()
-		vss        = kwargs.get("plaintext_matrix",[])
-		new_kwargs = lambda vs: {**{"plaintext_vector":vs},**kwargs}
-		M_         = np.array([ self.encryptVector(**new_kwargs(vs)) for vs in vss ])
+		vss        = np.asarray(kwargs.get("plaintext_matrix",[]))
+		if(kwargs.get("workers",1) > 1 or kwargs.get("seed") is not None or kwargs.get("output_path") is not None):
+			M_ = self.parallelEncryptMatrix(**{**kwargs,"plaintext_matrix":vss})
+		else:
+			M_ = self.encryptTensor(**{**kwargs,"plaintext_matrix":vss})
 		end_time   = time()
 		encryption_time = end_time-start_time
 		return CipherschemeResult(
 			matrix         = M_, 
 			time           = encryption_time,
-			operation_type = "encrypt"
+			operation_type = "encrypt",
+			round          = bool(np.issubdtype(vss.dtype,np.integer))
 		)
 
+	"""
+	description: Batch encryption engine. Encrypts every scalar of a plaintext array in one pass,
+		the randomness R is drawn as a single (..., m) block and E1..Em are computed as
+		broadcast expressions over the secret key.
+	attributes:
+		plaintext_matrix: array of shape (n, a) (any shape is accepted)
+		secret_key: secret key
+		m: number of attributes of SK
+		rng: numpy Generator used to draw R (optional)
+		R: randomness block of shape (..., m) (optional)
+		out: preallocated array of shape (..., m) to write the ciphertexts into (optional)
+		dtype: np.float64 (default) or np.float32, the reduced-precision storage mode halves the
+			ciphertext memory (the secret key stays in float64)
+	constraints:
+		1. E1: sk[0][0] * sk[0][2] * v + sk[0][1] * R[m-1] + sk[0][0] * (R[0] - R[m-2])
+		2. Ei: sk[i][0] * sk[i][2] * v + sk[i][1] * R[m-1] + sk[i][0] * (R[i] - R[i-1])
+		3. Em: (sk[m-1][0] + sk[m-1][1] + sk[m-1][2]) * R[m-1]
+	return: ciphertext tensor of shape (..., m)
+    """
+	def encryptTensor(self,**kwargs):
+		V     = np.asarray(kwargs.get("plaintext_matrix",[]),dtype=np.float64)
+		sk    = np.asarray(kwargs.get("secret_key"),dtype=np.float64)
+		m     = kwargs.get("m",3)
+		E     = kwargs.get("out")
+		dtype = np.dtype(kwargs.get("dtype",np.float64) if(E is None) else E.dtype)
+		rng   = kwargs.get("rng") or np.random.default_rng()
+		R     = kwargs.get("R")
+		R     = rng.random(V.shape + (m,),dtype=dtype) if(R is None) else np.asarray(R,dtype=dtype)
+		K,S,T = sk[:m,0], sk[:m,1], sk[:m,2]
+		E     = np.empty(V.shape + (m,),dtype=dtype) if(E is None) else E
+		Rp    = R[...,:m-1]
+		Ep    = E[...,:m-1]
+		np.subtract(Rp, np.roll(Rp,1,axis=-1), out = Ep) # R[i] - R[i-1], R[0] - R[m-2] for E1
+		Ep   *= K[:m-1]
+		Ep   += S[:m-1] * R[...,m-1:]
+		Ep   += (K[:m-1] * T[:m-1]) * V[...,None]
+		np.multiply(R[...,m-1], K[m-1] + S[m-1] + T[m-1], out = E[...,m-1]) #Em formula
+		return E
+
+	"""
+	description: Encrypts row chunks of a plaintext matrix across a process pool. Workers write straight
+		into a shared memory block (or into the .npy memmap at output_path), no ciphertext is pickled back.
+	attributes:
+		plaintext_matrix: array of shape (n, a)
+		secret_key: secret key
+		m: number of attributes of SK
+		workers: number of processes (1 encrypts the chunks in the calling process straight into the output array)
+		seed: master seed, every chunk draws R from its own stream spawned from it
+		chunk_size: number of rows per task
+		output_path: .npy file to write the ciphertexts into (optional)
+		dtype: np.float64 (default) or np.float32
+	constraints:
+		1. The same seed and chunk_size give the same ciphertexts regardless of the number of workers.
+	return: ciphertext tensor of shape (n, a, m), a memmap when output_path is given
+	"""
+	def parallelEncryptMatrix(self,**kwargs):
+		V           = np.asarray(kwargs.get("plaintext_matrix",[[]]),dtype=np.float64)
+		sk          = kwargs.get("secret_key")
+		m           = kwargs.get("m",3)
+		workers     = kwargs.get("workers",1)
+		chunk_size  = max(1,kwargs.get("chunk_size",10000))
+		output_path = kwargs.get("output_path")
+		dtype       = np.dtype(kwargs.get("dtype",np.float64))
+		shape       = V.shape + (m,)
+		bounds      = [ (i, min(i + chunk_size, shape[0])) for i in range(0, shape[0], chunk_size) ]
+		seeds       = np.random.SeedSequence(kwargs.get("seed")).spawn(len(bounds))
+		shm         = None
+		if(output_path is not None):
+			out    = np.lib.format.open_memmap(output_path,mode="w+",dtype=dtype,shape=shape)
+			buffer = ("memmap",output_path)
+		elif(workers <= 1):
+			out    = np.empty(shape,dtype=dtype) #in-process, no shared block and no copy out of it
+		else:
+			shm    = shared_memory.SharedMemory(create = True, size = max(1,int(np.prod(shape)) * dtype.itemsize))
+			out    = np.ndarray(shape,dtype=dtype,buffer=shm.buf)
+			buffer = ("shm",shm.name)
+		try:
+			if(workers <= 1):
+				for (start,stop),seed in zip(bounds,seeds):
+					self.encryptTensor(
+						plaintext_matrix = V[start:stop],
+						secret_key       = sk,
+						m                = m,
+						rng              = np.random.default_rng(seed),
+						out              = out[start:stop]
+					)
+			else:
+				if(output_path is not None):
+					out.flush()
+				with ProcessPoolExecutor(max_workers = workers) as executor:
+					futures = [ executor.submit(_encryptChunk,
+						plaintext_matrix = V[start:stop],
+						secret_key       = sk,
+						m                = m,
+						seed             = seed,
+						buffer           = buffer,
+						shape            = shape,
+						dtype            = dtype,
+						start            = start,
+						stop             = stop
+					) for (start,stop),seed in zip(bounds,seeds) ]
+					for future in futures:
+						future.result()
+			if(output_path is not None):
+				return np.load(output_path,mmap_mode="r+")
+			if(shm is None):
+				return out
+			return np.array(out) #single memcpy out of the shared block before it is released
+		finally:
+			if(shm is not None):
+				del out
+				shm.close()
+				shm.unlink()
+
 	"""
 	description: split a plaintext vector into scalars
     """
@@ -70,59 +235,14 @@ class Liu(object):
 		return [ self.encryptScalar(**new_kwargs(v)) for v in vs ]
 
 	"""
-	description: Encrypt a plaintext using SK
-	attributes:
-		v: plaintext
-		sk: secret key
-		m: number of attributes of SK
-	constraints:
-		1. E1: sk[0][0] * sk[0][2] * v + sk[0][1] * self.R[m-1] + sk[0][0] * (self.R[0] - self.R[m-2])
-		2. Ei: sk[i][0] * sk[i][2] * v + sk[i][1] * self.R[m-1] + sk[i][0] * (self.R[i] - self.R[i-1])
-		3. Em: sk[m-1][0] + sk[m-1][1] + sk[m-1][2]) * self.R[m-1]
-		<ERROR> FIX IT LATER 
+	description: Encrypt a plaintext matrix, kept for compatibility (same as encryptMatrix)
     """
 	def vectorizeEncryptMatrix(self,**kwargs):
-		plaintext_matrix = kwargs.get("plaintext_matrix")
-		m                = kwargs.get("m")
-		sk               = kwargs.get("secret_key")
-		f                = self.curryingEncryptScalar(sk,m)
-		fx               = np.vectorize(f ,otypes =[object] )
-		start_time       = time()
-		M_               = np.asarray(list(map(lambda x: list(x),fx(plaintext_matrix.flatten()).tolist()))).flatten().reshape(plaintext_matrix.shape[0],plaintext_matrix.shape[1],m)
-		end_time         = time()
-		encryption_time  = end_time-start_time
-		return CipherschemeResult(
-			matrix         = M_, 
-			time           = encryption_time,
-			operation_type = "encrypt"
-		)
+		return self.encryptMatrix(**kwargs)
 		
 	def curryingEncryptScalar(self,sk,m): 
 		def __inner(v):
-			self.round = True if(type(v) == int or type(v) == np.int64) else False
-			self.E     = []
-			self.R     = [ self.generateRandom() for i in range (m) ]
-			e1         =  self.__eEncrypt(
-				ki = sk[0][0],
-				ti = sk[0][2],
-				v  = v, 
-				si = sk[0][1],
-				rm = self.R[m-1],
-				rrdiff = (self.R[0]-self.R[m-2])
-			)
-			self.E.append(e1) 
-			for i in range(1,m-1): #Ei formula
-				ei =  self.__eEncrypt(
-					ki = sk[i][0],
-					ti = sk[i][2],
-					v  = v, 
-					si = sk[i][1],
-					rm = self.R[m-1],
-					rrdiff = (self.R[i]-self.R[i-1])
-				)
-				self.E.append(ei)	
-			self.E.append((sk[m-1][0] + sk[m-1][1] + sk[m-1][2]) * self.R[m-1]) #Em Formula
-			return self.E
+			return self.encryptScalar(plaintext = v, secret_key = sk, m = m)
 		return __inner
 
 
@@ -132,39 +252,40 @@ class Liu(object):
 		v: plaintext
 		sk: secret key
 		m: number of attributes of SK
+		R: random numbers of the ciphertext (optional)
 	constraints:
-		1. E1: sk[0][0] * sk[0][2] * v + sk[0][1] * self.R[m-1] + sk[0][0] * (self.R[0] - self.R[m-2])
-		2. Ei: sk[i][0] * sk[i][2] * v + sk[i][1] * self.R[m-1] + sk[i][0] * (self.R[i] - self.R[i-1])
-		3. Em: sk[m-1][0] + sk[m-1][1] + sk[m-1][2]) * self.R[m-1]
+		1. E1: sk[0][0] * sk[0][2] * v + sk[0][1] * R[m-1] + sk[0][0] * (R[0] - R[m-2])
+		2. Ei: sk[i][0] * sk[i][2] * v + sk[i][1] * R[m-1] + sk[i][0] * (R[i] - R[i-1])
+		3. Em: sk[m-1][0] + sk[m-1][1] + sk[m-1][2]) * R[m-1]
     """
 	def encryptScalar(self,**kwargs): 
 		v          = kwargs.get("plaintext") 
-		self.round = kwargs.get("roundd", True if(type(v) == int or type(v) == np.int64) else False)
 		sk         = kwargs.get("secret_key")
 		m          = kwargs.get("m",3)
-		self.E     = []
-		self.R     = kwargs.get("R",[ self.generateRandom() for i in range (m) ])
+		E          = []
+		R          = kwargs.get("R")
+		R          = [ self.generateRandom() for i in range (m) ] if(R is None) else R
 		e1         =  self.__eEncrypt( #E1 formula
 			ki = sk[0][0],
 			ti = sk[0][2],
 			v  = v, 
 			si = sk[0][1],
-			rm = self.R[m-1],
-			rrdiff = (self.R[0]-self.R[m-2])
+			rm = R[m-1],
+			rrdiff = (R[0]-R[m-2])
 		)
-		self.E.append(e1) 
+		E.append(e1) 
 		for i in range(1,m-1): #Ei formula
 			ei =  self.__eEncrypt(
 				ki = sk[i][0],
 				ti = sk[i][2],
 				v  = v, 
 				si = sk[i][1],
-				rm = self.R[m-1],
-				rrdiff = (self.R[i]-self.R[i-1])
+				rm = R[m-1],
+				rrdiff = (R[i]-R[i-1])
 			)
-			self.E.append(ei)	
-		self.E.append((sk[m-1][0] + sk[m-1][1] + sk[m-1][2]) * self.R[m-1]) #Em Formula
-		return self.E
+			E.append(ei)	
+		E.append((sk[m-1][0] + sk[m-1][1] + sk[m-1][2]) * R[m-1]) #Em Formula
+		return E
 
 
 	"""
@@ -186,19 +307,17 @@ class Liu(object):
 
 
 	"""
-	description: split a ciphertext matrix into vectors
+	description: Decrypt a ciphertext matrix using the batch engine (see decryptTensor)
     """
 	def decryptMatrix(self,**kwargs):
 		start_time = time()
-		css        = kwargs.get("ciphertext_matrix",[])
-		new_kwargs = lambda cs: {**{"ciphertext_vector":cs},**kwargs}
-		M_ = [ self.decryptVector(**new_kwargs(cs)) for cs in css ]
+		M_         = self.decryptTensor(**kwargs)
 		end_time   = time()
 		decryption_time = end_time-start_time
 		return CipherschemeResult(
 			matrix         = M_, 
 			time           = decryption_time,
-			operation_type = "encrypt"
+			operation_type = "decrypt"
 		)
 		
 		
@@ -211,6 +330,86 @@ class Liu(object):
 		return [ self.decryptScalar(**new_kwargs(c)) for c in cs ]
 
 
+	"""
+	description: Turns SK into the length-m weight vector W used by the batch decryption.
+		Decryption is linear in the ciphertext components, v = E . W
+	attributes:
+		sk: secret key
+		m: number of attributes of SK
+	constraints:
+		1. T = t_1 + ... + t_(m-1)
+		2. Wi: 1 / (k_i * T)                                             i < m
+		3. Wm: -(s_1/k_1 + ... + s_(m-1)/k_(m-1)) / ((k_m + s_m + t_m) * T)
+	"""
+	def decryptionWeights(self,**kwargs):
+		sk    = np.asarray(kwargs.get("secret_key"),dtype=np.float64)
+		m     = kwargs.get("m",3)
+		K,S,T = sk[:m,0], sk[:m,1], sk[:m,2]
+		t     = T[:m-1].sum()
+		W     = np.empty(m,dtype=np.float64)
+		W[:m-1] = 1.0 / (K[:m-1] * t)
+		W[m-1]  = -(S[:m-1] / K[:m-1]).sum() / ((K[m-1] + S[m-1] + T[m-1]) * t)
+		return W
+
+	"""
+	description: Worst-case decryption error of ciphertexts stored in a reduced-precision dtype. Every
+		component E_i is stored with a relative error below eps, so v = E . W is off by at most
+		eps * sum_i |E_i| |W_i|: the bound depends on the key (small k_i give large weights) and on the
+		magnitude of the ciphertexts, not only on the magnitude of v.
+	attributes:
+		magnitude: |E| of the stored ciphertexts, shape (..., m) (or an upper bound of it, e.g. (m,))
+		secret_key: secret key (not required if weights is given)
+		weights: precomputed decryptionWeights (optional)
+		m: number of attributes of SK
+		dtype: storage dtype of the ciphertexts (default np.float32)
+	return: error bound of every plaintext, shape (...)
+	"""
+	def decryptionError(self,**kwargs):
+		m         = kwargs.get("m",3)
+		W         = kwargs.get("weights")
+		W         = self.decryptionWeights(secret_key = kwargs.get("secret_key",kwargs.get("sk")), m = m) if(W is None) else W
+		magnitude = np.abs(np.asarray(kwargs.get("magnitude"),dtype=np.float64))
+		return np.tensordot(magnitude,np.abs(W),axes=([-1],[0])) * np.finfo(kwargs.get("dtype",np.float32)).eps
+
+	"""
+	description: Batch decryption engine. Decrypts a whole (..., m) ciphertext tensor with a single tensordot.
+	attributes:
+		ciphertext_matrix: ciphertext tensor of shape (..., m)
+		secret_key: secret key (not required if weights is given)
+		weights: precomputed decryptionWeights (optional)
+		m: number of attributes of SK
+		round: rounds the plaintexts to integers, defaults to self.round
+		dtype: storage dtype the ciphertexts come from (default the dtype of ciphertext_matrix), set it to
+			np.float32 when a float64 tensor was computed from float32 ciphertexts (e.g. a shift matrix)
+		magnitude: |E| of the float32 ciphertexts the tensor was computed from (default |ciphertext_matrix|)
+	constraints:
+		1. float32 ciphertexts are only rounded when decryptionError is below 0.005 for every plaintext,
+			the rounding is then exact. Otherwise a ValueError is raised, decrypt them with round=False
+			or encrypt the dataset in float64.
+	return: plaintext array of shape (...)
+	"""
+	def decryptTensor(self,**kwargs):
+		E      = kwargs.get("ciphertext_matrix",[])
+		dtype  = np.dtype(kwargs.get("dtype",np.asarray(E).dtype))
+		E      = np.asarray(E,dtype=np.float64)
+		m      = kwargs.get("m",3)
+		W      = kwargs.get("weights")
+		W      = self.decryptionWeights(secret_key = kwargs.get("secret_key",kwargs.get("sk")), m = m) if(W is None) else W
+		round  = kwargs.get("round",self.round)
+		if(E.size == 0): #empty matrix (e.g. an empty cluster)
+			return np.zeros(E.shape[:-1] if(E.ndim > 1) else (0,))
+		V = np.tensordot(E,W,axes=([-1],[0]))
+		if(not round):
+			return V
+		if(dtype == np.float32):
+			magnitude = kwargs.get("magnitude")
+			error     = self.decryptionError(magnitude = E if(magnitude is None) else magnitude, weights = W, dtype = dtype)
+			if(np.max(error) >= 0.005):
+				raise ValueError("float32 ciphertexts can decrypt up to {:.3g} away from the plaintext with this key, they cannot be rounded, decrypt with round=False or use float64".format(np.max(error)))
+		V = np.trunc(np.around(V,decimals=2))
+		return V.astype(np.int64)
+
+
 	"""    
     description: Decrypt a ciphertext using SK
 	attributes:
@@ -218,35 +417,17 @@ class Liu(object):
 		sk: secret key
 		m: number of attributes of SK
 	"""
-	def curryingDecryptScalar(self,sk,m): 
+	def curryingDecryptScalar(self,sk,m,round=None): 
+		W     = self.decryptionWeights(secret_key = sk, m = m)
+		round = self.round if(round is None) else round
 		def __inner(E):
-			t,e = 0,0
-			for i in range(m-1):
-				ti = sk[i][2]
-				t += ti
-			s = (E[m-1]) / (sk[m-1][0] + sk[m-1][1] + sk[m-1][2])
-			for i in range(m-1):
-				ei = (E[i] - s * sk[i][1])/ sk[i][0]
-				e += ei
-			v = float(e)/float(t)
-			return int(np.around(v,decimals=2)) if(self.round) else v
+			v = float(np.dot(E,W))
+			return int(np.around(v,decimals=2)) if(round) else v
 
 		return __inner
 
 	def vectorizeDecryptMatrix(self,**kwargs):
-		plaintext_matrix = kwargs.get("ciphertext_matrix")
-		m                = kwargs.get("m")
-		sk               = kwargs.get("sk")
-		f                = self.curryingDecryptScalar(sk,m)
-		fx               = np.vectorize(f ,otypes =[object] )
-		start_time       = time()
-		M_               = fx(plaintext_matrix.flatten())
-		end_time         = time()
-		decryption_time  = end_time-start_time
-		return CipherschemeResult(
-			matrix         = M_,
-			time           = decryption_time,
-			operation_type = "decrypt" )
+		return self.decryptMatrix(**kwargs)
 
 	"""    
     description: Decrypt a ciphertext using SK
@@ -259,16 +440,10 @@ class Liu(object):
 		E  = kwargs.get("ciphertext")
 		sk = kwargs.get("secret_key")
 		m  = kwargs.get("m")
-		t,e = 0,0
-		for i in range(m-1):
-			ti = sk[i][2]
-			t += ti
-		s = (E[m-1]) / (sk[m-1][0] + sk[m-1][1] + sk[m-1][2])
-		for i in range(m-1):
-			ei = (E[i] - s * sk[i][1])/ sk[i][0]
-			e += ei
-		v = float(e)/float(t)
-		return int(np.around(v,decimals=2)) if(self.round) else v
+		W  = kwargs.get("weights")
+		W  = self.decryptionWeights(secret_key = sk, m = m) if(W is None) else W
+		v  = float(np.dot(E,W))
+		return int(np.around(v,decimals=2)) if(kwargs.get("round",self.round)) else v
 
 
 	"""
@@ -292,33 +467,61 @@ class Liu(object):
 	def multiply(**kwargs):
 		E1 = kwargs.get("ciphertext_1")
 		E2 = kwargs.get("ciphertext_2")
-		E3 = []
-		m  = len(E1)
-		for i in range(m):
-			for j in range(m):
-				E3.append(E1[i] * E2[j])
-		return E3
+		return Liu.multiplyTensor(ciphertext_1 = E1, ciphertext_2 = E2).tolist()
+
+	"""
+	description: Batch multiplication of two ciphertext tensors through an outer product over the component axis
+	attributes:
+		E1: first ciphertext tensor (..., m)
+		E2: second ciphertext tensor (..., m)
+	constraints:
+		1. E3[..., i*m + j] = E1[..., i] * E2[..., j]
+	return: ciphertext tensor of shape (..., m*m)
+    """
+	def multiplyTensor(**kwargs):
+		E1 = np.asarray(kwargs.get("ciphertext_1"),dtype=np.float64)
+		E2 = np.asarray(kwargs.get("ciphertext_2"),dtype=np.float64)
+		if(E1.shape[-1] != E2.shape[-1]):
+			raise ValueError("Ciphertexts with {} and {} components can not be multiplied".format(E1.shape[-1],E2.shape[-1]))
+		m  = E1.shape[-1]
+		E3 = E1[...,:,None] * E2[...,None,:]
+		return E3.reshape(E3.shape[:-2] + (m*m,))
 
 
 	"""
-	description: Check multiplication of two ciphertexts
+	description: Check multiplication of two ciphertexts (see decryptMultiplyTensor). Only the plaintext
+		product is rounded, the m inner decryptions are ciphertext components of the first factor and are kept exact.
 	attributes:
 		E: ciphertext
 		sk: secret key
 		m: number of attributes of SK
+		round: rounds the product to an integer, defaults to self.round
     """
 	def decrypt_multiply(self, **kwargs):
 		E  = kwargs.get("ciphertext")
-		sk = kwargs.get("secret_key")
-		m  = kwargs.get("m")
-		v1,v = [],[]
-		for i in range(len(E)):
-			v1.append(E[i])
-			if ((i%m)==(m-1)):
-				v.append(self.decryptScalar(ciphertext = v1, secret_key = sk, m = m))
-				v1 = []
-		self.E3 = self.decryptScalar(ciphertext = v, secret_key = sk, m = m)
-		return self.E3
+		return self.decryptMultiplyTensor(**{**kwargs,"ciphertext_matrix":E}).item()
+
+	"""
+	description: Batch decryption of ciphertext products. The m*m components are regrouped as an (m, m) block,
+		the inner groups are decrypted with one tensordot and the resulting ciphertext of the first factor with a second one.
+	attributes:
+		ciphertext_matrix: product tensor of shape (..., m*m)
+		secret_key: secret key (not required if weights is given)
+		weights: precomputed decryptionWeights (optional)
+		m: number of attributes of SK
+		round: rounds the plaintexts to integers, defaults to self.round
+	return: plaintext array of shape (...)
+    """
+	def decryptMultiplyTensor(self,**kwargs):
+		E     = np.asarray(kwargs.get("ciphertext_matrix"),dtype=np.float64)
+		m     = kwargs.get("m",3)
+		W     = kwargs.get("weights")
+		W     = self.decryptionWeights(secret_key = kwargs.get("secret_key"), m = m) if(W is None) else W
+		round = kwargs.get("round",self.round)
+		E     = E.reshape(E.shape[:-1] + (m,m))
+		V1    = np.tensordot(E,W,axes=([-1],[0])) #decrypt the second factor, leaves a ciphertext of the first one
+		V     = np.tensordot(V1,W,axes=([-1],[0]))
+		return np.trunc(np.around(V,decimals=2)).astype(np.int64) if(round) else V
 
 	""" 
 	description: Multiply a ciphertext by a plaintext
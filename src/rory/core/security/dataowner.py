@@ -1,9 +1,18 @@
 import numpy as np
+import os
 from utils.Utils import Utils
 from security.cryptosystem.FDHOpe import Fdhope
+from security.cryptosystem.fdhopesketch import FdhopeSketch
 from time import time
+from concurrent.futures import ThreadPoolExecutor
 from interfaces.dataowner_result import DataownerResult
+from interfaces.cipherscheme_result import CipherschemeResult
+from interfaces.outsourcing_delta import OutsourcingDelta
+from utils.artifactcache import ArtifactCache
+from security.hash.fingerprint import Fingerprint
 from logger.Dumblogger import DumbLogger
+from utils.constants import Constants
+from utils.condensedmatrix import CondensedMatrix
 
 """
 Description:
@@ -17,6 +26,9 @@ Attributes:
 	fdh_ope: 
 		represents the Frequency and Distribution Hiding OPE (FDH-OPE) 
 		scheme to facilitate operations for UDM.
+	cache: ArtifactCache or the path of its directory (optional)
+		on-disk cache of the Liu ciphertexts, plaintext UDM/EDM and FDH-OPE intervals, so outsourcing 
+		the same plaintext again (or for another algorithm) reuses them
 """
 class DataOwner(object):
 
@@ -27,7 +39,12 @@ class DataOwner(object):
 		self.m          = m 
 		self.liu_scheme = liu_scheme
 		self.sk         = self.liu_scheme.secretKey( m = self.m )
+		self.weights    = self.liu_scheme.decryptionWeights( secret_key = self.sk, m = self.m ) #computed once, used by every decryption
+		self.round      = self.liu_scheme.round #rounding mode of the outsourced data, set by outsourcedData
 		self.messageIntervals, self.cypherIntervals = {}, {}
+		self.outsourced = None #plaintext and settings of the last outsourcedData(incremental = True), used by append_records
+		cache           = kwargs.get("cache") #ArtifactCache shared by the outsourcing calls (optional)
+		self.cache      = ArtifactCache(path = cache) if(isinstance(cache,(str,os.PathLike))) else cache
 
 	"""
 	description: Data preparation.
@@ -36,6 +53,16 @@ class DataOwner(object):
 		a: number of attributes of D
 		threshold: how close the records must be to belong to the same cluster
 		algorithm: clustering algorithm to use
+		workers: number of processes used to encrypt the matrix, and of threads used to encrypt the UDM/EDM (default 1)
+		seed: master seed of the encryption randomness (Liu and FDH-OPE), makes the ciphertexts reproducible
+		chunk_size: rows encrypted per task
+		dtype: storage dtype of the ciphertexts and of the UDM/EDM, np.float64 (default) or np.float32
+		block_size: records per block when the UDM/EDM is built
+		udm_mode: Constants.UDMMode.FULL (default), KCOLUMNS (SKMEANS and DBSKMEANS) or CONDENSED
+		k: number of clusters, required by the KCOLUMNS mode
+		udm_path: .npy file where the UDM/EDM is built out-of-core (memmap) instead of in memory
+		pipeline: runs the Liu encryption of D concurrently with the UDM/EDM -> FDH-OPE keygen -> 
+			FDH-OPE encryption chain on a thread pool (default False, the stages run one after another)
 	"""
 	def outsourcedData(self,**kwargs):
 		plaintext_matrix = kwargs.get("plaintext_matrix",[[]])
@@ -44,21 +71,83 @@ class DataOwner(object):
 		threshold        = kwargs.get("threshold",0.01)
 		algorithm        = kwargs.get("algorithm","SKMEANS")
 		logger           = kwargs.get("logger",DumbLogger())
+		dtype            = kwargs.get("dtype",np.float64)
+		stage_times      = {}
+		fingerprint      = None if(self.cache is None) else Fingerprint.matrix(matrix = plaintext_matrix, workers = kwargs.get("workers",1))
 
-		encryption_result = self.liu_scheme.encryptMatrix( #The plaintext is sent to Liu scheme to encrypt
-			plaintext_matrix = plaintext_matrix,
-			secret_key       = self.sk,
-			m                = self.m
-		)
+		def encryptionStage():
+			encrypt = lambda: self.liu_scheme.encryptMatrix( #The plaintext is sent to Liu scheme to encrypt
+				plaintext_matrix = plaintext_matrix,
+				secret_key       = self.sk,
+				m                = self.m,
+				workers          = kwargs.get("workers",1),
+				seed             = kwargs.get("seed"),
+				chunk_size       = kwargs.get("chunk_size",10000),
+				dtype            = dtype
+			)
+			if(self.cache is None):
+				return encrypt()
+			key = self.cache.key( #the ciphertexts are only valid under the same secret key
+				kind       = "liu",
+				data       = fingerprint,
+				sk         = Fingerprint.matrix(matrix = self.sk),
+				m          = self.m,
+				dtype      = np.dtype(dtype).str,
+				seed       = kwargs.get("seed"),
+				chunk_size = kwargs.get("chunk_size",10000)
+			)
+			matrix = self.cache.get(key)
+			if(matrix is not None):
+				return CipherschemeResult(
+					matrix         = matrix,
+					time           = 0,
+					operation_type = "encrypt",
+					round          = bool(np.issubdtype(np.asarray(plaintext_matrix).dtype,np.integer))
+				)
+			encryption_result = encrypt()
+			self.cache.put(key,encryption_result.matrix)
+			return encryption_result
 
-		start_time_udm = time() 
-		U, encrypted_threshold = self.get_U( #U is generated according to the chosen algorithm
-			algorithm         = algorithm,
-			plaintext_matrix  = plaintext_matrix,
-			threshold         = threshold,
-			logger = logger
-		)
-		udm_time = time() - start_time_udm
+		def udmStage():
+			start_time_udm = time() 
+			U, encrypted_threshold = self.get_U( #U is generated according to the chosen algorithm
+				algorithm         = algorithm,
+				plaintext_matrix  = plaintext_matrix,
+				threshold         = threshold,
+				dtype             = dtype,
+				block_size        = kwargs.get("block_size",256),
+				udm_mode          = kwargs.get("udm_mode",Constants.UDMMode.FULL),
+				k                 = kwargs.get("k"),
+				udm_path          = kwargs.get("udm_path"),
+				workers           = kwargs.get("workers",1),
+				seed              = kwargs.get("seed"),
+				stage_times       = stage_times,
+				fingerprint       = fingerprint,
+				logger = logger
+			)
+			return U, encrypted_threshold, time() - start_time_udm
+
+		start_time = time()
+		if(kwargs.get("pipeline",False)): #both chains release the GIL in NumPy, they overlap on two threads
+			with ThreadPoolExecutor(max_workers = 2) as executor:
+				encryption_future = executor.submit(encryptionStage)
+				udm_future        = executor.submit(udmStage)
+				encryption_result = encryption_future.result()
+				U, encrypted_threshold, udm_time = udm_future.result()
+		else:
+			encryption_result = encryptionStage()
+			U, encrypted_threshold, udm_time = udmStage()
+		total_time = time() - start_time
+		self.round = encryption_result.round #integer plaintexts are rounded back when decrypted
+		stage_times["encryption"] = encryption_result.time
+		self.outsourced = None if(not kwargs.get("incremental",False)) else {
+			"plaintext_matrix" : np.array(plaintext_matrix,dtype=np.float64), #the new rows of the UDM/EDM are computed against every record
+			"algorithm"        : algorithm,
+			"udm_mode"         : kwargs.get("udm_mode",Constants.UDMMode.FULL),
+			"k"                : kwargs.get("k"),
+			"dtype"            : dtype,
+			"block_size"       : kwargs.get("block_size",256)
+		}
 
 		return DataownerResult(
 			UDM                   = U,
@@ -67,7 +156,140 @@ class DataOwner(object):
 			encrypted_matrix_time = encryption_result.time,
 			messageIntervals      = self.messageIntervals,
 			cypherIntervals       = self.cypherIntervals,
-			encrypted_threshold   = encrypted_threshold
+			encrypted_threshold   = encrypted_threshold,
+			stage_times           = stage_times,
+			critical_path_time    = max(encryption_result.time, udm_time), #longest chain of dependent stages
+			total_time            = total_time
+		)
+
+	"""
+	description: Incremental outsourcing. Encrypts only the new records and computes only the new rows 
+		(and columns) of the UDM/EDM of the dataset outsourced by outsourcedData, with the same Liu and 
+		FDH-OPE keys. The dataset must be outsourced with incremental = True. The workers merge the returned 
+		delta with Utils.mergeDelta.
+	attributes:
+		plaintext_matrix: new records (p x a)
+		workers: processes used by the Liu encryption, threads used by the FDH-OPE encryption
+		seed: master seed of the Liu encryption of the new records
+	return: OutsourcingDelta
+	"""
+	def append_records(self,**kwargs):
+		if(self.outsourced is None):
+			raise ValueError("append_records needs a dataset outsourced with outsourcedData(incremental = True)")
+		X          = np.asarray(kwargs.get("plaintext_matrix"),dtype=np.float64)
+		workers    = kwargs.get("workers",1)
+		algorithm  = self.outsourced["algorithm"]
+		udm_mode   = self.outsourced["udm_mode"]
+		dtype      = self.outsourced["dtype"]
+		start      = len(self.outsourced["plaintext_matrix"])
+		D          = np.concatenate((self.outsourced["plaintext_matrix"],X))
+		encryption_result = self.liu_scheme.encryptMatrix( #only the new records are encrypted
+			plaintext_matrix = X,
+			secret_key       = self.sk,
+			m                = self.m,
+			workers          = workers,
+			seed             = kwargs.get("seed"),
+			chunk_size       = kwargs.get("chunk_size",10000),
+			dtype            = dtype
+		)
+		start_time_udm = time()
+		columns        = self.outsourced["k"] if(udm_mode == Constants.UDMMode.KCOLUMNS) else None
+		if(algorithm == "DBSNNC"):
+			rows = self.__calculateDM( #rows start..N-1 of ED
+				plaintext_matrix = D,
+				dtype            = dtype,
+				block_size       = self.outsourced["block_size"],
+				first_row        = start
+			)
+		else:
+			rows = self.__calculateUDM( #rows start..N-1 of U
+				plaintext_matrix = D,
+				dtype            = dtype,
+				block_size       = self.outsourced["block_size"],
+				columns          = columns,
+				first_row        = start
+			)
+		if(algorithm != "SKMEANS"): #the new values are encrypted with the FDH-OPE key of the dataset
+			self.__encryptLower(
+				plaintext_matrix = rows,
+				out              = rows,
+				first_row        = start,
+				sens             = self.sens if(algorithm == "DBSKMEANS") else 0,
+				rng              = np.random.default_rng()
+			)
+			if(columns is None): #U[y][x] = U[x][y] among the new records, as encrypt_U does
+				p     = len(X)
+				block = np.array(rows[:,start:])
+				upper = np.triu(np.ones((p,p),dtype=bool),1).reshape((p,p) + (1,) * (block.ndim - 2))
+				rows[:,start:] = np.where(upper, np.swapaxes(block,0,1), block)
+		condensed   = (udm_mode == Constants.UDMMode.CONDENSED)
+		udm_columns = None
+		if(condensed):
+			rows = rows[np.tri(len(D),dtype=bool)[start:]] #entries y <= x of the new rows
+		elif(columns is None):
+			udm_columns = np.swapaxes(rows[:,:start],0,1) #stored rows, new columns
+			udm_columns = -udm_columns if(algorithm == "SKMEANS") else udm_columns.copy() #plaintext U is antisymmetric, the encrypted U and ED are mirrored
+		udm_time = time() - start_time_udm
+		self.outsourced["plaintext_matrix"] = D
+		return OutsourcingDelta(
+			start                 = start,
+			encrypted_matrix      = encryption_result.matrix,
+			encrypted_matrix_time = encryption_result.time,
+			udm_rows              = rows,
+			udm_columns           = udm_columns,
+			udm_time              = udm_time,
+			condensed             = condensed
+		)
+
+	"""
+	description: Streaming file-to-file encryption. Reads the plaintext in row chunks and writes the ciphertext
+		tensor into a .npy file through a memmap, peak memory is bounded by chunk_size rather than n*a*m.
+	attributes:
+		source_path: plaintext matrix (.npy or CSV)
+		destination_path: .npy file of the ciphertext tensor (n, a, m)
+		chunk_size: number of rows encrypted at once
+		seed: master seed of the encryption randomness (same streams as outsourcedData with the same chunk_size)
+		delimiter, skip_header: CSV options
+		round: rounding mode of the decryption for CSV sources (.npy sources use their dtype)
+		dtype: storage dtype of the ciphertexts, np.float64 (default) or np.float32
+	"""
+	def encrypt_file(self,**kwargs):
+		source_path      = kwargs.get("source_path")
+		destination_path = kwargs.get("destination_path")
+		chunk_size       = kwargs.get("chunk_size",10000)
+		start_time       = time()
+		(n,a),dtype      = Utils.getShapeOfFile(
+			path        = source_path,
+			delimiter   = kwargs.get("delimiter",","),
+			skip_header = kwargs.get("skip_header",0)
+		)
+		nchunks = (n + chunk_size - 1) // chunk_size
+		seeds   = np.random.SeedSequence(kwargs.get("seed")).spawn(nchunks)
+		out     = np.lib.format.open_memmap(destination_path,mode="w+",dtype=kwargs.get("dtype",np.float64),shape=(n,a,self.m))
+		start   = 0
+		chunks  = Utils.iterMatrixChunks(
+			path        = source_path,
+			chunk_size  = chunk_size,
+			delimiter   = kwargs.get("delimiter",","),
+			skip_header = kwargs.get("skip_header",0)
+		)
+		for chunk,seed in zip(chunks,seeds):
+			stop = start + chunk.shape[0]
+			self.liu_scheme.encryptTensor(
+				plaintext_matrix = chunk,
+				secret_key       = self.sk,
+				m                = self.m,
+				rng              = np.random.default_rng(seed),
+				out              = out[start:stop]
+			)
+			start = stop
+		out.flush()
+		self.round = kwargs.get("round",bool(np.issubdtype(dtype,np.integer)))
+		return CipherschemeResult(
+			matrix         = out,
+			time           = time() - start_time,
+			operation_type = "encrypt",
+			round          = self.round
 		)
 
 	"""
@@ -76,145 +298,371 @@ class DataOwner(object):
 		plaintext_matrix: original dataset (numerical)
 		threshold: how close the records must be to belong to the same cluster
 		algorithm: clustering algorithm to use
+		dtype: storage dtype of the UDM/EDM
+		block_size: records per block when the UDM/EDM is built
+		udm_mode: Constants.UDMMode.FULL, KCOLUMNS or CONDENSED. 
+			KCOLUMNS only computes the n x k x a slice against the first k (seed) records, 
+			which is all that SKMEANS and DBSKMEANS ever read.
+			CONDENSED stores the lower triangle of the antisymmetric UDM (or of the symmetric EDM for DBSNNC) 
+			in a CondensedMatrix.
+		k: number of clusters, required by the KCOLUMNS mode
+		udm_path: .npy file where the UDM/EDM is built out-of-core (memmap) instead of in memory
+		workers: threads used to encrypt the UDM/EDM with FDH-OPE
+		stage_times: dict where the time of every stage ("udm", "keygen", "fdhope") is recorded
+		fingerprint: fingerprint of plaintext_matrix, computed when a cache is used and it is not given
+		seed: master seed of the FDH-OPE key and noise, makes the encrypted UDM/EDM reproducible
 	"""
 	def get_U(self,**kwargs):
 		plaintext_matrix = kwargs.get("plaintext_matrix")
 		threshold        = kwargs.get("threshold")
 		algorithm        = kwargs.get("algorithm")
+		dtype            = kwargs.get("dtype",np.float64)
+		block_size       = kwargs.get("block_size",256)
+		udm_mode         = kwargs.get("udm_mode",Constants.UDMMode.FULL)
+		udm_path         = kwargs.get("udm_path")
 		logger           = kwargs.get("logger",DumbLogger())
+		stage_times      = kwargs.get("stage_times",{})
 		encrypted_threshold = 0 #threshold is 0 if not required by the algorithm
+		columns          = None #all the columns of U
+		condensed        = (udm_mode == Constants.UDMMode.CONDENSED)
+		if(udm_mode == Constants.UDMMode.KCOLUMNS):
+			columns = kwargs.get("k")
+			if(columns is None or algorithm == "DBSNNC"):
+				raise ValueError("The KCOLUMNS mode requires k and is only available for SKMEANS and DBSKMEANS")
 
-		if (algorithm == "SKMEANS"): 
-			U  = self.__calculateUDM( #Matrix UDM is created
-				plaintext_matrix = plaintext_matrix
-				)
-		elif(algorithm == "DBSKMEANS"):
-			EU  = self.__calculateUDM( # Matrix UDM is created
-				plaintext_matrix = plaintext_matrix
-				)
-			self.messageIntervals, self.cypherIntervals = Fdhope.keygen( #the intervals (SK) of each space are generated
-				dataset = EU
-			)
-			U = self.encrypt_U( #Matrix EU is encrypted
-				U = EU,
-				algorithm = algorithm
-			)
-		elif(algorithm == "DBSNNC"):
-			ED  = self.__calculateDM( #Matrix ED is created
-				plaintext_matrix = plaintext_matrix
-			)
-			self.messageIntervals, self.cypherIntervals = Fdhope.keygen( #the intervals (SK) of each space are generated
-			dataset = ED,
-			logger = logger
+		if(algorithm not in ("SKMEANS","DBSKMEANS","DBSNNC")):
+			raise ValueError("Unknown algorithm {}".format(algorithm))
+		cache       = self.cache if(udm_path is None) else None #an out-of-core U stays where the caller asked
+		fingerprint = kwargs.get("fingerprint")
+		if(cache is not None and fingerprint is None):
+			fingerprint = Fingerprint.matrix(matrix = plaintext_matrix)
+		n           = Utils.getShapeOfMatrix(plaintext_matrix)[0]
+		sketch      = FdhopeSketch() #filled block by block while U is built (DBSKMEANS, DBSNNC)
+		keySeed, noiseSeed = (int(x) for x in np.random.SeedSequence(kwargs.get("seed")).generate_state(2)) #fresh entropy without a seed
+
+		start_time = time()
+		if (algorithm == "DBSNNC"): 
+			U, hit = self.__cachedMatrix( #Matrix ED is created, or read from the cache
+				cache     = cache,
+				condensed = condensed,
+				symmetric = True,
+				n         = n,
+				compute   = lambda: self.__calculateDM(
+					plaintext_matrix = plaintext_matrix,
+					dtype            = dtype,
+					block_size       = block_size,
+					condensed        = condensed,
+					path             = udm_path,
+					sketch           = sketch
+				),
+				kind      = "edm",
+				data      = fingerprint,
+				udm_mode  = udm_mode,
+				dtype     = np.dtype(dtype).str
 			)
-			U = self.encrypt_U( #Matrix EU is encrypted
-				U = ED,
-				algorithm = algorithm
+		else: #SKMEANS and DBSKMEANS share the plaintext UDM
+			U, hit = self.__cachedMatrix( #Matrix UDM is created, or read from the cache
+				cache     = cache,
+				condensed = condensed,
+				symmetric = False,
+				n         = n,
+				compute   = lambda: self.__calculateUDM(
+					plaintext_matrix = plaintext_matrix,
+					dtype            = dtype,
+					block_size       = block_size,
+					columns          = columns,
+					condensed        = condensed,
+					path             = udm_path,
+					sketch           = sketch
+				),
+				kind      = "udm",
+				data      = fingerprint,
+				udm_mode  = udm_mode,
+				columns   = columns,
+				dtype     = np.dtype(dtype).str
 			)
+		stage_times["udm"] = time() - start_time
+		if(algorithm == "SKMEANS"):
+			return U, encrypted_threshold
+
+		start_time   = time()
+		intervals, _ = self.__cachedMatrix( #the intervals (SK) of each space are generated, or read from the cache
+			cache     = cache,
+			compute   = lambda: np.stack(Fdhope.keygen(
+				sketch  = None if(hit) else sketch, #a cached U was not sketched, keygen streams it
+				dataset = U,
+				seed    = keySeed,
+				logger  = logger
+			)),
+			kind      = "fdhope",
+			data      = fingerprint,
+			algorithm = algorithm,
+			udm_mode  = udm_mode,
+			columns   = columns,
+			dtype     = np.dtype(dtype).str
+		)
+		self.messageIntervals, self.cypherIntervals = intervals[0], intervals[1]
+		stage_times["keygen"] = time() - start_time
+		start_time = time()
+		U = self.encrypt_U( #Matrix U is encrypted
+			U          = U,
+			algorithm  = algorithm,
+			block_size = block_size,
+			workers    = kwargs.get("workers",1),
+			seed       = noiseSeed
+		)
+		if(algorithm == "DBSNNC"):
 			encrypted_threshold = Fdhope.encrypt( #Threshold is encrypted
 				plaintext    = threshold,
 				messagespace = self.messageIntervals, 
 				cipherspace  = self.cypherIntervals,
 				logger = logger
 			)
+		stage_times["fdhope"] = time() - start_time
 
 		return U, encrypted_threshold
 
 
 	"""
-	description: allows to encrypt the U
+	description: Artifact read from the cache or, when it is missing (or there is no cache), computed and stored
+	attributes:
+		cache: ArtifactCache or None
+		compute: function that computes the artifact
+		condensed, symmetric, n: a CondensedMatrix is stored as its data and rebuilt when read
+		**parts: kind of artifact, fingerprint and parameters, they form the key
+	return: (artifact, True if it was read from the cache)
+	"""
+	def __cachedMatrix(self,**kwargs):
+		cache     = kwargs.pop("cache",None)
+		compute   = kwargs.pop("compute")
+		condensed = kwargs.pop("condensed",False)
+		symmetric = kwargs.pop("symmetric",False)
+		n         = kwargs.pop("n",0)
+		if(cache is None):
+			return compute(), False
+		key    = cache.key(**kwargs)
+		matrix = cache.get(key)
+		if(matrix is None):
+			matrix = compute()
+			cache.put(key, matrix.data if(isinstance(matrix,CondensedMatrix)) else matrix)
+			return matrix, False
+		if(condensed):
+			matrix = CondensedMatrix(n = n, symmetric = symmetric, data = matrix)
+		return matrix, True
+
+	"""
+	description: allows to encrypt the U. The lower triangle (y <= x) is encrypted with Fdhope.encrypt_array in 
+		blocks of block_size rows, spread over workers threads (NumPy releases the GIL), and written into 
+		out. The upper triangle is never encrypted, it is filled from the encrypted lower one, U[y][x] = U[x][y], 
+		with one block copy per row block; a CondensedMatrix has no upper triangle and is encrypted as it is stored.
 	attributes:
-		U: matrix to be encrypted
+		U: matrix to be encrypted (UDM for DBSKMEANS, EDM for DBSNNC), dense, memmap or CondensedMatrix
 		algorithm: clustering algorithm to use
+		out: preallocated output with the shape of U (default U itself, encrypted in place)
+		block_size: rows encrypted per task (default 256)
+		workers: number of threads (default 1)
+		seed: master seed of the FDH-OPE noise (DBSKMEANS)
 	"""
 	def encrypt_U(self,**kwargs):
-		U         = kwargs.get("U")
-		Ushape    = Utils.getShapeOfMatrix(U)
-		algorithm = kwargs.get("algorithm")
-		
-		for x in range(Ushape[0]): 
-			for y in range(x):
-				if (algorithm == "DBSKMEANS"): #if the algorithm is dbskmeans, one more dimension needs to be traversed
-					for z in range(Ushape[2]):
-						U[x][y][z] = Fdhope.encrypt( #the lower triangle of U is encrypted
-							plaintext    = U[x][y][z], 
-							sens         = self.sens, 
-							messagespace = self.messageIntervals, 
-							cipherspace  = self.cypherIntervals
-						)
-						U[y][x][z] = U[x][y][z] #the equivalent position is obtained to fill the upper triangle
-				elif(algorithm == "DBSNNC"):
-					U[x][y] = Fdhope.encrypt( #the lower triangle of U is encrypted
-						plaintext    = U[x][y], 
-						messagespace = self.messageIntervals, 
-						cipherspace  = self.cypherIntervals
-					)
-					U[y][x] = U[x][y] #the equivalent position is obtained to fill the upper triangle
-		return U
+		U          = kwargs.get("U")
+		algorithm  = kwargs.get("algorithm")
+		block_size = max(1,kwargs.get("block_size",256))
+		workers    = kwargs.get("workers",1)
+		U          = U if(isinstance(U,(np.ndarray,CondensedMatrix))) else np.array(U,dtype=np.float64)
+		out        = kwargs.get("out")
+		if(out is None):
+			out = U
+		elif(isinstance(U,CondensedMatrix)):
+			out.data[...] = U.data
+		sens       = self.sens if(algorithm == "DBSKMEANS") else 0 #the EDM is encrypted deterministically
+		source     = U.data if(isinstance(U,CondensedMatrix)) else U
+		target     = out.data if(isinstance(out,CondensedMatrix)) else out
+		bounds     = [ (start, min(start + block_size, len(source))) for start in range(0,len(source),block_size) ]
+		seeds      = np.random.SeedSequence(kwargs.get("seed")).spawn(len(bounds))
+
+		def encryptBlock(start,stop,seed):
+			if(isinstance(out,CondensedMatrix)): #only the lower triangle is stored
+				Fdhope.encrypt_array(
+					plaintext_matrix = source[start:stop],
+					sens             = sens,
+					messagespace     = self.messageIntervals,
+					cipherspace      = self.cypherIntervals,
+					rng              = np.random.default_rng(seed),
+					out              = target[start:stop]
+				)
+			else:
+				self.__encryptLower(plaintext_matrix = source[start:stop], out = target[start:stop], first_row = start, sens = sens, rng = np.random.default_rng(seed))
+
+		def mirrorBlock(start,stop):
+			columns = Utils.getShapeOfMatrix(target)[1] #n, or k for a KCOLUMNS UDM
+			stop    = min(stop,columns)
+			if(start >= stop):
+				return
+			target[:start,start:stop] = np.swapaxes(target[start:stop,:start],0,1) #U[y][x] = U[x][y], y < start <= x
+			block   = np.array(target[start:stop,start:stop])
+			upper   = np.triu(np.ones((stop - start,stop - start),dtype=bool),1).reshape((stop - start,stop - start) + (1,) * (block.ndim - 2))
+			target[start:stop,start:stop] = np.where(upper, np.swapaxes(block,0,1), block) #the same inside the diagonal block
+
+		with ThreadPoolExecutor(max_workers = max(1,workers)) as executor:
+			list(executor.map(lambda task: encryptBlock(*task), [ bound + (seed,) for bound,seed in zip(bounds,seeds) ]))
+			if(not isinstance(out,CondensedMatrix)): #the upper triangle is read from the encrypted lower one
+				list(executor.map(lambda bound: mirrorBlock(*bound), bounds))
+		return out
+
+	"""
+	description: FDH-OPE encryption of the entries y <= x of the rows x = first_row..first_row+len-1 of a 
+		dense UDM/EDM (or of its first columns for KCOLUMNS), the other entries of out are left as they are
+		for the mirror of the lower triangle.
+	attributes:
+		plaintext_matrix: the rows (len x columns [x a])
+		out: output rows, it may be plaintext_matrix itself
+		first_row: record of the first row
+		sens: sensitivity of the FDH-OPE noise
+		rng: source of the noise
+	"""
+	def __encryptLower(self,**kwargs):
+		source  = kwargs.get("plaintext_matrix")
+		target  = kwargs.get("out")
+		first   = kwargs.get("first_row",0)
+		rows, columns = np.shape(target)[:2]
+		encrypt = lambda values, out: Fdhope.encrypt_array(
+			plaintext_matrix = values,
+			sens             = kwargs.get("sens",0),
+			messagespace     = self.messageIntervals,
+			cipherspace      = self.cypherIntervals,
+			rng              = kwargs.get("rng"),
+			out              = out
+		)
+		left    = min(first,columns)
+		encrypt(source[:,:left], target[:,:left]) #y < first <= x
+		right   = min(first + rows,columns)
+		if(first < right): #y <= x inside the diagonal block
+			lower    = np.tri(rows,right - first,dtype=bool)
+			diagonal = target[:,first:right]
+			diagonal[lower] = encrypt(source[:,first:right][lower], None)
 
+	"""
+	description: UDM matrix calculation, U[x][y][z] = D[x][z] - D[y][z] (Utils.fxTesis).
+		Rows are broadcast in blocks of block_size records straight into a preallocated array.
+	attributes:
+		D: numeric dataset
+		a: number of attributes of D
+		block_size: number of records (rows of U) computed per block
+		dtype: storage dtype of the UDM
+		columns: only the first columns records are used as columns of U (n x columns x a)
+		condensed: returns the lower triangle as an antisymmetric CondensedMatrix (n(n+1)/2 x a)
+		path: .npy file, the UDM (or the condensed data) is written block by block into a memmap of it
+		sketch: FdhopeSketch updated with every block, so the FDH-OPE key needs no second pass over U
+		first_row: only the rows first_row..n-1 of the dense U are computed (records appended to an outsourced dataset)
+	"""
 	def __calculateUDM(self,**kwargs):
-		try:
-			D      = kwargs.get("plaintext_matrix")
-			DShape = Utils.getShapeOfMatrix(D)
-			a      = kwargs.get("attributes",DShape[1])
-			U      = []
-			fx     = Utils.fxTesis    
-
-			for x in range(DShape[0]):  # Construcción de U vacia 
-				U.append([]) 
-				for y in range(DShape[0]):
-					U[x].append([])
-					for z in range(a):
-						U[x][y].append([])
-						value = fx(D,x,y,z)
-						U[x][y][z]=value
-			return np.array(U)
-		except Exception as e:
-			print(e)
-			raise e
-
-	"""
-	description: EDM matrix calculation
+		D          = np.asarray(kwargs.get("plaintext_matrix"),dtype=np.float64)
+		a          = kwargs.get("attributes",D.shape[1])
+		block_size = max(1,kwargs.get("block_size",256))
+		n          = D.shape[0]
+		columns    = kwargs.get("columns")
+		columns    = n if(columns is None) else min(columns,n)
+		D          = D[:,:a]
+		sketch     = kwargs.get("sketch")
+		first_row  = kwargs.get("first_row",0)
+		if(kwargs.get("condensed",False) and first_row == 0):
+			data = self.__allocate(path = kwargs.get("path"), shape = (n * (n + 1) // 2, a), dtype = kwargs.get("dtype",np.float64))
+			U    = CondensedMatrix(n = n, symmetric = False, data = data)
+			for start in range(0,n,block_size):
+				stop  = min(start + block_size, n)
+				lower = np.tri(stop,dtype=bool)[start:stop] #y <= x, row-major order matches the condensed layout
+				U.data[U.offset(start):U.offset(stop)] = (D[start:stop,None,:] - D[None,:stop,:])[lower]
+				if(sketch is not None):
+					sketch.update(U.data[U.offset(start):U.offset(stop)])
+			return U
+		U          = self.__allocate(path = kwargs.get("path"), shape = (n - first_row,columns,a), dtype = kwargs.get("dtype",np.float64))
+		for start in range(first_row,n,block_size):
+			stop = min(start + block_size, n)
+			np.subtract(D[start:stop,None,:], D[None,:columns,:], out = U[start - first_row:stop - first_row]) # D[i-block,None,:] - D[None,:,:]
+			if(sketch is not None):
+				sketch.update(U[start - first_row:stop - first_row])
+		return U
+
+	"""
+	description: Output array of the UDM/EDM, in memory or, when a path is given, a .npy memmap
+		so matrices larger than RAM are written (and later read) tile by tile
+	attributes:
+		path: .npy file (optional)
+		shape: shape of the matrix
+		dtype: storage dtype
+	"""
+	def __allocate(self,**kwargs):
+		path  = kwargs.get("path")
+		shape = kwargs.get("shape")
+		dtype = kwargs.get("dtype",np.float64)
+		if(path is None):
+			return np.empty(shape,dtype=dtype)
+		return np.lib.format.open_memmap(path, mode = "w+", dtype = dtype, shape = shape)
+
+	"""
+	description: EDM matrix calculation, ED[x][y] = sum_z |D[x][z] - D[y][z]| (Manhattan distance).
+		The EDM is symmetric, so only the lower triangle is computed: rows are processed in blocks of 
+		block_size records against the records before them and the upper triangle is mirrored (or not 
+		stored at all in the condensed form). Each block accumulates one attribute at a time, keeping 
+		the temporaries at block_size x n.
 	attributes:
 		D: numeric dataset
 		a: number of attributes of D
+		block_size: number of records (rows of ED) computed per block
+		dtype: storage dtype of the EDM
+		condensed: returns the lower triangle as a symmetric CondensedMatrix (n(n+1)/2 entries)
+		path: .npy file, the EDM (or the condensed data) is written block by block into a memmap of it
+		sketch: FdhopeSketch updated with the lower triangle of every block
+		first_row: only the rows first_row..n-1 of the dense ED are computed (records appended to an outsourced dataset)
 	"""
 	def __calculateDM(self,**kwargs): #Calculo de la matriz DM
-		D      = kwargs.get("plaintext_matrix")
-		DShape = Utils.getShapeOfMatrix(D)
-		a      = kwargs.get("attributes",DShape[1]) 
-		
-		ED     = []
-		for x in range(DShape[0]): 
-			ED.append([]) 
-			#for y in range(DShape[0]):
-			 #   ED[x].append([])
-		
-		for x in range(DShape[0]): #Llenado de U con distancias entre los datos en plano	
-			for y in range(DShape[0]):
-				dist = 0
-				#print("_______")
-				for z in range(a):
-					dist += abs(D[x][z] - D[y][z])
-					#print("0", D[x][z], "1", D[y][z], "dist", dist)
-					#print("dist",dist)
-				ED[x].append(dist)
-			#print(ED)
-		return np.array(ED)
+		D          = np.asarray(kwargs.get("plaintext_matrix"),dtype=np.float64)
+		a          = kwargs.get("attributes",D.shape[1]) 
+		block_size = max(1,kwargs.get("block_size",256))
+		dtype      = kwargs.get("dtype",np.float64)
+		condensed  = kwargs.get("condensed",False)
+		sketch     = kwargs.get("sketch")
+		first_row  = kwargs.get("first_row",0)
+		n          = D.shape[0]
+		D          = np.ascontiguousarray(D[:,:a].T) #one contiguous row per attribute
+		condensed  = condensed and first_row == 0
+		if(condensed):
+			ED = CondensedMatrix(n = n, symmetric = True, data = self.__allocate(path = kwargs.get("path"), shape = (n * (n + 1) // 2,), dtype = dtype))
+		else:
+			ED = self.__allocate(path = kwargs.get("path"), shape = (n - first_row,n), dtype = dtype)
+		for start in range(first_row,n,block_size): #Llenado de ED con distancias entre los datos en plano
+			stop  = min(start + block_size, n)
+			block = np.zeros((stop - start, stop))
+			for z in range(a): #block[x][y] += |D[x][z] - D[y][z]| for y < stop
+				block += np.abs(D[z,start:stop,None] - D[z,None,:stop])
+			lower = block[np.tri(stop,dtype=bool)[start:stop]] #y <= x, row-major order matches the condensed layout
+			if(sketch is not None):
+				sketch.update(lower)
+			if(condensed):
+				ED.data[ED.offset(start):ED.offset(stop)] = lower
+			else:
+				ED[start - first_row:stop - first_row,:stop] = block
+				ED[:start - first_row,start:stop]           = block[:,first_row:start].T #upper triangle mirrored from the lower one
+		return ED
 		
 	"""
 	description: dataowner participation for shift matrix decryption
 	attributes:
 		S1: shift matrix
 		m: number of attributes of SK
+		dtype: storage dtype of the ciphertexts S1 was computed from (default float64)
+		magnitude: bound of |E| of those ciphertexts, checks that float32 shifts still round exactly (Liu.decryptTensor)
 	"""
 	def userActions(self,**kwargs):
 		S1 = kwargs.get("shift_matrix",[])
 		m  = kwargs.get("m",3)
 		S  = self.liu_scheme.decryptMatrix(
 			ciphertext_matrix = S1,
-			secret_key        = self.sk,
-			m                 = self.m
+			weights           = self.weights,
+			m                 = self.m,
+			round             = self.round,
+			dtype             = kwargs.get("dtype",np.float64),
+			magnitude         = kwargs.get("magnitude")
 		)
 		return S.matrix
 
@@ -231,8 +679,9 @@ class DataOwner(object):
 		for cipher_cluster in cipher_clusters:
 			S  = self.liu_scheme.decryptMatrix(
 				ciphertext_matrix = cipher_cluster,
-				secret_key        = self.sk,
-				m                 = self.m
+				weights           = self.weights,
+				m                 = self.m,
+				round             = self.round
 			)
 			Ss.append(S)
 		return Ss
@@ -0,0 +1,77 @@
+import hashlib
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from utils.condensedmatrix import CondensedMatrix
+
+"""
+Description:
+	Fingerprints (blake2b digests) of plaintext matrices, UDM/EDM and ciphertext tensors, used as
+	cache keys, to deduplicate uploads and to check that a worker holds the same UDM as the data owner.
+	The bytes of the matrix are read through a memoryview (an ndarray or a .npy memmap is never copied)
+	and split in leaves of leaf_size bytes. Every leaf is hashed on its own and the root digest is the
+	blake2b of the dtype, the shape and the leaf digests (Merkle style), so the leaves can be hashed by
+	several threads (hashlib releases the GIL) and the fingerprint does not depend on the number of workers.
+Attributes:
+	leaf_size: bytes per leaf (default 16 MiB), part of the definition of the fingerprint
+	digest_size: bytes of the fingerprint (default 16)
+"""
+class Fingerprint(object):
+
+	"""
+	description: Fingerprint of a matrix as an hexadecimal string
+	attributes:
+		matrix: list, ndarray, .npy memmap or CondensedMatrix
+		workers: threads hashing the leaves (default 1)
+		leaf_size: bytes per leaf (default 16 MiB)
+		digest_size: bytes of the fingerprint (default 16)
+	"""
+	def matrix(**kwargs):
+		xs          = kwargs.get("matrix")
+		workers     = kwargs.get("workers",1)
+		leaf_size   = max(1,kwargs.get("leaf_size",2**24))
+		digest_size = kwargs.get("digest_size",16)
+		header      = ""
+		if(isinstance(xs,CondensedMatrix)):
+			header = "condensed:{}:{}:".format(xs.n,xs.symmetric)
+			xs     = xs.data
+		xs     = np.asarray(xs) #lists, no copy for an ndarray or memmap
+		header = "{}{}{}".format(header,xs.dtype.str,xs.shape).encode()
+		leaves = list(Fingerprint.leaves(matrix = xs, leaf_size = leaf_size))
+		hashLeaf = lambda leaf: hashlib.blake2b(leaf, digest_size = digest_size, person = b"rory-leaf").digest()
+		if(workers > 1 and len(leaves) > 1):
+			with ThreadPoolExecutor(max_workers = workers) as executor:
+				digests = list(executor.map(hashLeaf,leaves))
+		else:
+			digests = [ hashLeaf(leaf) for leaf in leaves ]
+		root = hashlib.blake2b(header, digest_size = digest_size, person = b"rory-root")
+		for digest in digests:
+			root.update(digest)
+		return root.hexdigest()
+
+	"""
+	description: Bytes of a matrix as consecutive leaves of leaf_size bytes (memoryview slices, no copies).
+		A non-contiguous matrix is made contiguous one slice of rows at a time.
+	"""
+	def leaves(**kwargs):
+		xs        = kwargs.get("matrix")
+		leaf_size = kwargs.get("leaf_size",2**24)
+		if(xs.flags.c_contiguous):
+			view = memoryview(xs.reshape(-1).view(np.uint8)) if(xs.size > 0) else memoryview(b"")
+			for start in range(0,max(len(view),1),leaf_size):
+				yield view[start:start + leaf_size]
+			return
+		rows    = max(1,leaf_size // max(1,xs[0].nbytes)) if(len(xs) > 0) else 1
+		pending = b""
+		for start in range(0,len(xs),rows): #leaves of leaf_size bytes across the copied slices
+			pending += np.ascontiguousarray(xs[start:start + rows]).tobytes()
+			while(len(pending) >= leaf_size):
+				yield pending[:leaf_size]
+				pending = pending[leaf_size:]
+		if(len(pending) > 0 or xs.size == 0):
+			yield pending
+
+	"""
+	description: True when two matrices (e.g. the UDM of the data owner and the one held by a worker) have the same fingerprint
+	"""
+	def equals(x,y,**kwargs):
+		return Fingerprint.matrix(matrix = x, **kwargs) == Fingerprint.matrix(matrix = y, **kwargs)
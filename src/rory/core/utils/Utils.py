@@ -1,7 +1,10 @@
 import numpy as np
 import pandas as pd
 import requests
-# from constants import Constants
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from utils.condensedmatrix import CondensedMatrix
+from utils.constants import Constants
 # from core.security.cryptosystem.liu import Liu
 from uuid import uuid4
 #from typing import deprecated
@@ -12,14 +15,146 @@ class Utils(object):
 	def __init__(self):
 		pass	
 	
+	"""
+	description: Initial centroids of the plaintext baseline, the seed records of Utils.selectSeeds over the 
+		L1 distances of the plaintext (the UDM L1 norms of the secure algorithms, so both start from the same records)
+	attributes:
+		k: number of clusters
+		plain_matrix: plaintext dataset (n x a)
+		seeding: Constants.Seeding strategy (default FIRST, the first k records)
+		seed: seed of the random choices
+	"""
 	def generate_centroids(**kwargs):
 		k            = kwargs.get("k",3)
-		plain_matrix = kwargs.get("plain_matrix")
-		centroids    = []
-		for x in range(k):
-			centroids.append(plain_matrix[x])
+		plain_matrix = np.asarray(kwargs.get("plain_matrix"))
+		seeds        = Utils.selectSeeds(
+			n        = len(plain_matrix),
+			k        = k,
+			distance = lambda s: np.abs(plain_matrix - plain_matrix[s]).sum(axis = 1),
+			seeding  = kwargs.get("seeding",Constants.Seeding.FIRST),
+			seed     = kwargs.get("seed")
+		)
 		columns = Utils.getShapeOfMatrix(plain_matrix)[1]
-		return np.array(centroids).reshape(k,columns)
+		return np.array(plain_matrix[seeds]).reshape(k,columns)
+
+	"""
+	description: Seed records, the first k records (FIRST), a farthest-first traversal (FARTHEST) or a k-means++ 
+		D^2 sampling (KMEANSPP) started from a random record. The random choices are reproducible with seed.
+	attributes:
+		n: number of records
+		k: number of clusters
+		distance: function of a record s returning the float64 distances of the n records to s
+		seeding: Constants.Seeding strategy (default FIRST)
+		seed: seed of the random choices
+	return: int array with the k seed records
+	"""
+	def selectSeeds(**kwargs):
+		n        = kwargs.get("n")
+		k        = kwargs.get("k")
+		distance = kwargs.get("distance")
+		seeding  = kwargs.get("seeding",Constants.Seeding.FIRST)
+		if(seeding == Constants.Seeding.FIRST):
+			return np.arange(k)
+		if(seeding not in (Constants.Seeding.FARTHEST,Constants.Seeding.KMEANSPP)):
+			raise ValueError("Unknown seeding strategy {}".format(seeding))
+		rng     = np.random.default_rng(kwargs.get("seed"))
+		seeds   = [int(rng.integers(n))]
+		nearest = distance(seeds[0]) #distance of every record to its nearest seed
+		while(len(seeds) < k):
+			chosen         = np.zeros(n,dtype=bool)
+			chosen[seeds]  = True
+			if(seeding == Constants.Seeding.FARTHEST):
+				s = int(np.argmax(np.where(chosen, -np.inf, nearest)))
+			else:
+				weights = np.where(chosen, 0, nearest) ** 2
+				total   = weights.sum()
+				s       = int(rng.choice(n, p = weights / total)) if(total > 0) else int(rng.choice(np.flatnonzero(~chosen))) #duplicates of the seeds
+			seeds.append(s)
+			nearest = np.minimum(nearest, distance(s))
+		return np.array(seeds)
+
+	"""
+	description: Columns of the UDM, columns[x][j] = D[x] - D[s_j] for s_j in columns. The lower triangle (x >= s)
+		is read as stored and the upper one as -U[s][x], so the antisymmetric plaintext UDM and the mirrored 
+		encrypted UDM give the same kind of column.
+	attributes:
+		UDM: dense, memmap, CondensedMatrix or KCOLUMNS (only its k columns) UDM
+		columns: record indexes
+	return: array n x len(columns) x a
+	"""
+	def udmColumns(**kwargs):
+		U       = kwargs.get("UDM")
+		columns = np.asarray(kwargs.get("columns"),dtype=np.int64)
+		if(isinstance(U,CondensedMatrix)):
+			return CondensedMatrix(n = U.n, symmetric = False, data = U.data).gather(rows = np.arange(U.n), columns = columns)
+		U = np.asarray(U)
+		if(len(columns) > 0 and columns.max() >= U.shape[1]):
+			raise ValueError("Column {} is not stored in a UDM of shape {}, seeding needs the FULL or CONDENSED UDM".format(columns.max(),U.shape))
+		block = np.array(U[:,columns])
+		for j,s in enumerate(columns):
+			block[:s,j] = -U[s,:s]
+		return block
+
+	"""
+	description: Record order of a seeded SKMeans/DBSKMeans. The seed records (Utils.selectSeeds over the L1 norms 
+		sum_z |U[x][s][z]|) go first and the others keep their order, so the algorithms that seed with the first k 
+		records run unchanged on D1[order] and on the n x k x a UDM of the seeds.
+	attributes:
+		UDM: dense, memmap or CondensedMatrix UDM (plaintext or encrypted)
+		k: number of clusters
+		attributes: number of attributes of U used (default all)
+		seeding: Constants.Seeding strategy (default FIRST, nothing is reordered)
+		seed: seed of the random choices
+	return: (order, U0), order is None and U0 is UDM for FIRST, otherwise U0[x][j] = U[order[x]][order[j]] (n x k x a)
+	"""
+	def seedPermutation(**kwargs):
+		U       = kwargs.get("UDM")
+		k       = kwargs.get("k")
+		seeding = kwargs.get("seeding",Constants.Seeding.FIRST)
+		if(seeding == Constants.Seeding.FIRST):
+			return None, U
+		n       = len(U)
+		a       = kwargs.get("attributes",Utils.getShapeOfMatrix(U)[2])
+		columns = {}
+		def distance(s):
+			columns[s] = Utils.udmColumns(UDM = U, columns = [s])[:,0]
+			return Utils.l1Norms(columns[s][:,None,:a], a)[:,0]
+		seeds   = Utils.selectSeeds(n = n, k = k, distance = distance, seeding = seeding, seed = kwargs.get("seed"))
+		rest    = np.ones(n,dtype=bool)
+		rest[seeds] = False
+		order   = np.concatenate((seeds,np.flatnonzero(rest)))
+		U0      = np.stack([ columns[s] for s in seeds ],axis = 1)[order]
+		return order, U0
+
+	"""
+	description: Label vector of the records in their original order, from the labels of D1[order]
+	"""
+	def restoreOrder(**kwargs):
+		label_vector = kwargs.get("label_vector")
+		order        = kwargs.get("order")
+		if(order is None):
+			return label_vector
+		labels        = np.empty(len(order),dtype=np.int64)
+		labels[order] = label_vector
+		return labels.tolist()
+
+	"""
+	description: n x k x a UDM of a seeded run, U0[x][j] = U[order[x]][order[j]] for j < k, rebuilt from the
+		outsourced UDM and the order of Utils.seedPermutation (it is the U0 seedPermutation returns)
+	attributes:
+		UDM: dense, memmap or CondensedMatrix UDM
+		order: record order of the seeded run, None for FIRST
+		k: number of clusters
+	return: U0, UDM itself when order is None
+	"""
+	def seededUDM(**kwargs):
+		U     = kwargs.get("UDM")
+		order = kwargs.get("order")
+		if(order is None):
+			return U
+		order = np.asarray(order,dtype=np.int64)
+		return Utils.udmColumns(UDM = U, columns = order[:kwargs.get("k")])[order]
+
 	def fillLabelVector(**kwargs):
 		label_vector = kwargs.get("label_vector",[])
 		k = kwargs.get("k",2)
@@ -46,19 +181,112 @@ class Utils(object):
 		try:
 			path         = kwargs.get("path")
 			allow_pickle = kwargs.get("allow_pickle",False)
-			xs           = np.load(path,allow_pickle=allow_pickle)
+			mmap_mode    = kwargs.get("mmap_mode",None) # "r" maps the file instead of loading it
+			xs           = np.load(path,allow_pickle=allow_pickle,mmap_mode=mmap_mode)
 			return xs
 		except Exception as e:
 			print(str(e))
 			raise e
 	
+	"""
+	description: Shape and dtype of a plaintext matrix stored in a .npy or CSV file, without loading it
+	attributes:
+		path: .npy or CSV file
+		delimiter: CSV delimiter
+		skip_header: number of CSV lines to skip
+	"""
+	def getShapeOfFile(**kwargs):
+		path        = kwargs.get("path")
+		delimiter   = kwargs.get("delimiter",",")
+		skip_header = kwargs.get("skip_header",0)
+		if(str(path).endswith(".npy")):
+			xs = np.load(path,mmap_mode="r")
+			return xs.shape, xs.dtype
+		rows,columns = 0,0
+		with open(path,"r") as f:
+			for line in islice(f,skip_header,None):
+				if(line.strip() == ""):
+					continue
+				if(rows == 0):
+					columns = len(line.split(delimiter))
+				rows += 1
+		return (rows,columns), np.dtype(np.float64)
+
+	"""
+	description: Reads a plaintext matrix stored in a .npy or CSV file as a stream of row chunks,
+		at most chunk_size rows are held in memory at once.
+	attributes:
+		path: .npy or CSV file
+		chunk_size: number of rows per chunk
+		delimiter: CSV delimiter
+		skip_header: number of CSV lines to skip
+	"""
+	def iterMatrixChunks(**kwargs):
+		path        = kwargs.get("path")
+		chunk_size  = max(1,kwargs.get("chunk_size",10000))
+		delimiter   = kwargs.get("delimiter",",")
+		skip_header = kwargs.get("skip_header",0)
+		if(str(path).endswith(".npy")):
+			xs = np.load(path,mmap_mode="r")
+			for start in range(0,xs.shape[0],chunk_size):
+				yield np.array(xs[start:start+chunk_size])
+			return
+		with open(path,"r") as f:
+			lines = (line for line in islice(f,skip_header,None) if line.strip() != "")
+			while True:
+				chunk = list(islice(lines,chunk_size))
+				if(len(chunk) == 0):
+					return
+				yield np.loadtxt(chunk,delimiter=delimiter,ndmin=2)
+
 	def getShapeOfMatrix(xs):
-		xsType = type(xs)
-		if(np.ndarray == xsType):
+		if(hasattr(xs,"shape")): #ndarray, memmap or CondensedMatrix
 			return xs.shape
 		else: 
 			return np.array(xs).shape
 
+	"""
+	description: Casts a matrix to dtype, without a copy when it already has it. 
+		A CondensedMatrix keeps its condensed storage. An out-of-core .npy memmap is never cast, that would
+		copy the whole file into memory: its dtype must already be dtype.
+	"""
+	def asMatrix(xs,dtype=np.float64):
+		data = xs.data if(isinstance(xs,CondensedMatrix)) else xs
+		if(isinstance(data,np.memmap) and data.dtype != np.dtype(dtype)):
+			raise ValueError("The memmap UDM is {} and would be copied into memory as {}, use dtype={} (or convert the file)".format(data.dtype,np.dtype(dtype),data.dtype))
+		if(isinstance(xs,CondensedMatrix)):
+			return xs.astype(dtype)
+		return np.asarray(xs,dtype=dtype)
+
+
+	"""
+	description: Merges the delta of DataOwner.append_records into the stored UDM/EDM and ciphertext matrix
+	attributes:
+		UDM: stored UDM/EDM (dense, KCOLUMNS or CondensedMatrix)
+		encrypted_matrix: stored ciphertexts (n x a x m)
+		delta: OutsourcingDelta
+	return: (UDM, encrypted_matrix) of the n + p records
+	"""
+	def mergeDelta(**kwargs):
+		U     = kwargs.get("UDM")
+		D1    = np.asarray(kwargs.get("encrypted_matrix"))
+		delta = kwargs.get("delta")
+		n     = len(U)
+		if(delta.start != n or len(D1) != n):
+			raise ValueError("The delta starts at record {} but {} records are stored".format(delta.start,n))
+		D1 = np.concatenate((D1,np.asarray(delta.encrypted_matrix,dtype=D1.dtype)))
+		if(isinstance(U,CondensedMatrix)):
+			data = np.concatenate((U.data,np.asarray(delta.udm_rows,dtype=U.dtype))) #new rows of the lower triangle follow the stored ones
+			return CondensedMatrix(n = len(D1), symmetric = U.symmetric, data = data), D1
+		U = np.asarray(U)
+		if(delta.udm_columns is None): #KCOLUMNS, the columns are the first k records
+			return np.concatenate((U,np.asarray(delta.udm_rows,dtype=U.dtype))), D1
+		N     = len(D1)
+		U1    = np.empty((N,N) + U.shape[2:],dtype=U.dtype)
+		U1[:n,:n] = U
+		U1[:n,n:] = delta.udm_columns
+		U1[n:]    = delta.udm_rows
+		return U1, D1
 
 	def downloadSaveAndLoad(**kwargs):
 		try:
@@ -137,84 +365,218 @@ class Utils(object):
 		return np.all( np.array(S) ==0 )
 
 	"""
-	description: Assign remaining registers of D1 to clusters
+	description: Reads the rows of a matrix as dense tiles.
+	attributes:
+		matrix: dense array, .npy memmap or CondensedMatrix
+		start, stop: rows to read
+		columns: only the first columns columns are read (all by default)
+	"""
+	def readRowTile(**kwargs):
+		U       = kwargs.get("matrix")
+		start   = kwargs.get("start",0)
+		stop    = kwargs.get("stop",len(U))
+		columns = kwargs.get("columns",None)
+		if(isinstance(U,CondensedMatrix)):
+			return U.rowBlock(start = start, stop = stop, columns = U.n if(columns is None) else columns)
+		return np.array(np.asarray(U[start:stop])[:,:columns]) #np.array forces the (disk) read of the tile
+
+	"""
+	description: Streams over the rows of a (possibly out-of-core) matrix in tiles of tile_size rows.
+		With prefetch a background thread reads the next tile while the current one is processed.
+	attributes:
+		matrix: dense array, .npy memmap or CondensedMatrix
+		start, stop: rows to stream over
+		columns: only the first columns columns are read (all by default)
+		tile_size: rows per tile
+		prefetch: read ahead one tile in a background thread (default True)
+	return: generator of (start, stop, tile)
+	"""
+	def iterRowTiles(**kwargs):
+		U         = kwargs.get("matrix")
+		start     = kwargs.get("start",0)
+		stop      = kwargs.get("stop",len(U))
+		columns   = kwargs.get("columns",None)
+		tile_size = max(1,kwargs.get("tile_size",1024))
+		prefetch  = kwargs.get("prefetch",True)
+		bounds    = [ (i, min(i + tile_size, stop)) for i in range(start, stop, tile_size) ]
+		read      = lambda i,j: Utils.readRowTile(matrix = U, start = i, stop = j, columns = columns)
+		if(not prefetch or len(bounds) <= 1):
+			for i,j in bounds:
+				yield i, j, read(i,j)
+			return
+		with ThreadPoolExecutor(max_workers = 1) as executor:
+			future = executor.submit(read,*bounds[0])
+			for index,(i,j) in enumerate(bounds):
+				tile = future.result()
+				if(index + 1 < len(bounds)):
+					future = executor.submit(read,*bounds[index + 1]) #the next tile is read while this one is processed
+				yield i, j, tile
+
+	"""
+	description: Update of the UDM after the centroids moved, U1[x][y][z] = U[x][y][z] + S[y][z] for y < k.
+		The first update (initial) builds the n x k x a U1 from the outsourced UDM: the rows are one
+		broadcast addition per tile and the k x k head is folded from the lower triangle, U[x][y] = -U[y][x]
+		for x < y < k (the encrypted UDM mirrors its lower triangle), so every entry of U1 is the distance
+		of record x to centroid y. The next updates only add S to that U1 in place.
+	attributes:
+		UDM: outsourced UDM (dense, memmap, KCOLUMNS or CondensedMatrix) or the U1 of the previous update
+		shift_matrix: plaintext or FDH-OPE encrypted shift matrix (k x a)
+		k: number of clusters
+		attributes: number of attributes of U used (default all the attributes of S)
+		initial: UDM is the outsourced UDM (default True), False when it is the U1 of the previous update
+		dtype: dtype of U1 in the first update (default float64)
+		out: preallocated n x k x a array for the first update (optional)
+		tile_size: rows of U read at once
+	return: U1 (the UDM itself when initial is False)
+	"""
+	def shiftUDM(**kwargs):
+		U         = kwargs.get("UDM")
+		S         = np.asarray(kwargs.get("shift_matrix"),dtype=np.float64)
+		k         = kwargs.get("k")
+		a         = kwargs.get("attributes",S.shape[1])
+		tile_size = kwargs.get("tile_size",1024)
+		S         = S[:,:a]
+		if(not kwargs.get("initial",True)):
+			U1  = np.asarray(U)
+			U1 += S
+			return U1
+		out = kwargs.get("out")
+		if(out is None):
+			out = np.empty((len(U),k,a),dtype=kwargs.get("dtype",np.float64))
+		head  = Utils.readRowTile(matrix = U, start = 0, stop = k, columns = k)[:,:,:a].astype(np.float64) #k x k x a
+		upper = np.triu(np.ones((k,k),dtype=bool),1)[:,:,None] #y > x
+		head  = np.where(upper, -head.transpose(1,0,2), head) + S
+		for i,j,tile in Utils.iterRowTiles(matrix = U, columns = k, tile_size = tile_size):
+			np.add(tile[:,:,:a], S, out = out[i:j])
+		out[:k] = head
+		return out
+
+	"""
+	description: sum_z |tile[x][y][z]| for the first a attributes, accumulated attribute by attribute in float64
+		(the order of the scalar loop, every assignment kernel uses it so the labels agree)
+	return: float64 array with the first two dimensions of tile
+	"""
+	def l1Norms(tile,a):
+		sim = np.zeros(tile.shape[:2])
+		for z in range(a):
+			sim += np.abs(tile[:,:,z])
+		return sim
+
+	"""
+	description: Vectorized assignment kernel. Record x goes to the cluster y < k with the smallest 
+		sum_z |U[x][y][z]|. The rows stream in tiles. Ties go to the lowest y, like list.index(min(...)), 
+		and the sums are accumulated attribute by attribute in float64, in the order of the scalar loop, 
+		so the labels are the same. The upper triangle of an outsourced UDM needs no fold here,
+		|-U[y][x]| = |U[y][x]|.
+	attributes:
+		UDM: dense, memmap, KCOLUMNS, CondensedMatrix or the U1 of Utils.shiftUDM
+		k: number of clusters
+		start, stop: records to assign (default all)
+		attributes: number of attributes of U used (default all)
+		tile_size: rows of U read at once
+	return: int32 array with the labels of the records start..stop-1
+	"""
+	def assignLabels(**kwargs):
+		U         = kwargs.get("UDM")
+		k         = kwargs.get("k")
+		start     = kwargs.get("start",0)
+		stop      = kwargs.get("stop",len(U))
+		tile_size = kwargs.get("tile_size",1024)
+		labels    = np.empty(max(0,stop - start),dtype=np.int32)
+		tiles     = Utils.iterRowTiles(matrix = U, start = start, stop = stop, columns = k, tile_size = tile_size)
+		for i,j,tile in tiles:
+			sim = Utils.l1Norms(tile, kwargs.get("attributes",tile.shape[2]))
+			labels[i - start:j - start] = np.argmin(sim,axis = 1)
+		return labels
+
+	"""
+	description: Assign remaining registers of D1 to clusters. The labels come from Utils.assignLabels and
+		every cluster is the array of the indexes of its members, in record order. The records before
+		rid are the seeds, record y starts cluster y. The ciphertexts of the members are only gathered 
+		from D1 when ciphertexts is True.
 	attributes:
 		rid: record id 
 		U: Updatable distance matrix
-		C: Set of clusters
-		D1: Encrypted dataset 
-		Cent_i: conjunto de centroides
-		a: Number of attributes of D1
-		k: Number of clusters
+		k: Number of clusters (default len(clusters))
+		D1: Encrypted dataset, only read with ciphertexts
+		a: Number of attributes of U used
+		tile_size: rows of U read at once, U can be an out-of-core .npy memmap
+		label_vector: labels already computed for the records rid..n-1 (optional)
+		ciphertexts: return the ciphertexts of the members instead of their indexes (default False)
+	return: (C, label_vector), C[y] is an int64 array with the records of cluster y (their ciphertexts with ciphertexts)
 	"""
 	def populateClusters(**kwargs):
-		try:
-			rid     = kwargs.get("record_id",0)
-			U       = kwargs.get("UDM")
-			C       = kwargs.get("clusters")
-			D1      = kwargs.get("ciphertext_matrix")
-			D1Shape = Utils.getShapeOfMatrix(D1)
-			Cent_i  = kwargs.get("centroids",None)
-			a       = kwargs.get("attributes",D1Shape[1])
-			label_vector = []
-			
-			def calculateSimilarity(**kwargs):
-				limit = kwargs.get("limit")
-				sim   = kwargs.get("sim")
-				x,y   = kwargs.get("xy",(0,0))
-				for z in range(limit):
-					sim += abs(U[x][y][z])
-				return sim
-			
-			for x in range(rid,D1Shape[0]): #loop from k+1 to size of D1
-				sim1 = []
-				for y in range(len(C)): #from 0 to ks
-					if y > x: #complete U is checked
-						sim = calculateSimilarity(limit = a, sim = 0, xy = (y,x))
-					else:
-						sim = calculateSimilarity(limit = a, sim = 0, xy = (x,y))
-					sim1.append(sim)
-				min_index = sim1.index(min(sim1)) # the element with the least distance is located
-				label_vector.append(min_index) #fill label_vector with the index of the shortest distance
-				C[min_index].append(D1[x].tolist()) #the nearest element is placed in C
-			return C, label_vector
-		except Exception as e:
-			print(e)
-			raise e
+		rid    = kwargs.get("record_id",0)
+		U      = kwargs.get("UDM")
+		k      = kwargs.get("k") or len(kwargs.get("clusters"))
+		labels = kwargs.get("label_vector") #labels of the records record_id.. computed by the caller (e.g. AssignmentBounds)
+		if(labels is None):
+			labels = Utils.assignLabels(
+				UDM        = U,
+				k          = k,
+				start      = rid,
+				stop       = len(U),
+				attributes = kwargs.get("attributes",Utils.getShapeOfMatrix(U)[2]),
+				tile_size  = kwargs.get("tile_size",1024)
+			)
+		labels  = np.asarray(labels,dtype=np.int32)
+		order   = np.argsort(labels,kind="stable") + rid #record indexes grouped by cluster, in record order
+		members = np.split(order,np.cumsum(np.bincount(labels,minlength=k))[:-1])
+		C       = [ np.concatenate(([y] if(y < rid) else [],members[y])).astype(np.int64) for y in range(k) ]
+		if(kwargs.get("ciphertexts",False)):
+			D1 = np.asarray(kwargs.get("ciphertext_matrix"))
+			C  = [ D1[C[y]] for y in range(k) ]
+		return C, labels.tolist()
+
+	"""
+	description: Vectorized centroid kernel. The encrypted centroid of cluster y is the homomorphic mean
+		of the ciphertexts labeled y: segment sums with np.add.at (accumulated in record order, like the 
+		chain of Liu.add) followed by one broadcast multiplication by 1/|C_y| (Liu.multiply_c). 
+		Empty clusters keep a zero centroid.
+	attributes:
+		ciphertext_matrix: ciphertext tensor (n x a x m)
+		label_vector: cluster of every record (n)
+		k: Number of clusters
+	return: array with the k encrypted centroids (k x a x m)
+	"""
+	def centroidsFromLabels(**kwargs):
+		D1     = np.asarray(kwargs.get("ciphertext_matrix"),dtype=np.float64)
+		labels = np.asarray(kwargs.get("label_vector"),dtype=np.intp)
+		k      = kwargs.get("k")
+		sums   = np.zeros((k,) + D1.shape[1:])
+		np.add.at(sums,labels,D1)
+		count  = np.bincount(labels,minlength=k)
+		scale  = np.divide(1, count, out = np.zeros(k), where = count > 0) #1/|C_y|, 0 for an empty cluster
+		return sums * scale.reshape((k,) + (1,) * (D1.ndim - 1))
 
 	"""
-	description: Generates a new set of centroids
+	description: Generates a new set of centroids, from the clusters or, without copying the members,
+		from the ciphertext tensor and the labels (Utils.centroidsFromLabels)
 	attributes:
 		C: Set of clusters
+		ciphertext_matrix, label_vector: D1 and the cluster of every record, used instead of C
 		a: Number of attributes of D1
 		k: Number of clusters
 		m: number of attributes of SK
+	return: list with the k encrypted centroids (k x a x m)
 	"""
 	def calculateCentroids(**kwargs):
 		try:
-			C    = kwargs.get("clusters")
-			k    = kwargs.get("k")
-			a    = kwargs.get("attributes")
-			m    = kwargs.get("m")
-			Liu  = kwargs.get("Liu")
-			cent = np.zeros((k,a,m)).tolist() #define cent as an empty array
-			for j in range(k):
-				average = np.zeros((a,m)).tolist() #the average of the current cluster will be saved
-				cjLen   = len(C[j]) #number of elements in the current cluster
-				if(cjLen  == 0): #if the current cluster has no elements
-					cent[j]= np.zeros((a,m)).tolist() #fill that cluster with zeros
-				else: 
-					for i in range(cjLen):  
-						rec1 = C[j][i] #extract the first record from the cluster
-						for q in range(a): #traverse the record
-							E1 = average[q] #extract what is found in average
-							E2 = rec1[q] #extract an attribute from the record
-							average[q] = Liu.add(ciphertext_1 = E1, ciphertext_2 = E2) #make a homomorphic sum
-					for q in range(a): # the attributes are traversed to do the multiplication
-						v1 = 1/cjLen 
-						E1 = average[q] #extract what is found in average
-						cent[j][q] = Liu.multiply_c(scalar = v1, ciphertext_1 = E1) #make a homomorphic multiply
-			return cent
+			C      = kwargs.get("clusters")
+			k      = kwargs.get("k")
+			a      = kwargs.get("attributes")
+			m      = kwargs.get("m")
+			labels = kwargs.get("label_vector")
+			D1     = kwargs.get("ciphertext_matrix")
+			if(labels is None): #the members are concatenated cluster by cluster, in the order of C
+				sizes  = [ len(C[j]) for j in range(k) ]
+				D1     = np.concatenate([ np.asarray(C[j],dtype=np.float64).reshape((-1,a,m)) for j in range(k) ])
+				labels = np.repeat(np.arange(k),sizes)
+			return Utils.centroidsFromLabels(
+				ciphertext_matrix = np.asarray(D1)[:,:a],
+				label_vector      = labels,
+				k                 = k
+			).tolist()
 		except Exception as e:
 			print(e)
 			raise e
@@ -0,0 +1,96 @@
+import os
+import hashlib
+import numpy as np
+from uuid import uuid4
+
+"""
+Description:
+	Content-addressed on-disk cache of the outsourcing artifacts of DataOwner (Liu ciphertexts,
+	plaintext UDM, EDM and FDH-OPE intervals). Every artifact is a .npy file named after its key,
+	a digest of the fingerprint of the plaintext (security.hash.fingerprint) and of the parameters that produced it.
+	The cache is bounded to max_bytes: when it grows beyond, the least recently used files
+	(oldest modification time, refreshed on every hit) are removed.
+	The artifacts include the plaintext UDM/EDM and the FDH-OPE key, so there is no default (shared)
+	directory: the directory is private to its owner (0700) and every file is created 0600.
+Attributes:
+	path: directory of the cache (required)
+	max_bytes: maximum size of the cache on disk (default 1 GiB)
+"""
+class ArtifactCache(object):
+	def __init__(self,**kwargs):
+		self.path      = kwargs.get("path")
+		self.max_bytes = kwargs.get("max_bytes",2**30)
+		if(self.path is None):
+			raise ValueError("ArtifactCache needs an explicit path, it stores plaintext UDMs and FDH-OPE keys")
+		os.makedirs(self.path,mode=0o700,exist_ok=True)
+		os.chmod(self.path,0o700) #an existing directory is made private too, it fails if it belongs to another user
+
+	"""
+	description: Key of an artifact from the parts that identify it (kind, fingerprints, parameters)
+	"""
+	def key(self,**kwargs):
+		parts = ";".join("{}={}".format(name,kwargs[name]) for name in sorted(kwargs))
+		return hashlib.blake2b(parts.encode(),digest_size = 16).hexdigest()
+
+	def __file(self,key):
+		return os.path.join(self.path,"{}.npy".format(key))
+
+	"""
+	description: Cached artifact or None. A hit refreshes its position in the LRU order.
+	attributes:
+		key: key of the artifact
+		mmap_mode: "r" maps the file instead of loading it
+	"""
+	def get(self,key,mmap_mode=None):
+		path = self.__file(key)
+		try:
+			xs = np.load(path,mmap_mode=mmap_mode)
+			os.utime(path)
+			return xs
+		except (FileNotFoundError,ValueError,OSError):
+			return None
+
+	"""
+	description: Stores an artifact (written to a temporary file and renamed, so readers never see a partial file)
+	"""
+	def put(self,key,matrix):
+		path      = self.__file(key)
+		temporary = os.path.join(self.path,".{}.tmp".format(uuid4().hex))
+		with os.fdopen(os.open(temporary,os.O_WRONLY | os.O_CREAT | os.O_EXCL,0o600),"wb") as f:
+			np.save(f,np.asarray(matrix))
+		os.replace(temporary,path)
+		self.evict(keep = path)
+		return matrix
+
+	"""
+	description: Removes least recently used artifacts until the cache fits in max_bytes
+	attributes:
+		keep: file that is never removed (the one just stored)
+	"""
+	def evict(self,keep=None):
+		entries = []
+		for name in os.listdir(self.path):
+			if(not name.endswith(".npy")):
+				continue
+			path = os.path.join(self.path,name)
+			try:
+				stat = os.stat(path)
+			except FileNotFoundError: #removed by another process
+				continue
+			entries.append((stat.st_mtime,stat.st_size,path))
+		total = sum(size for _,size,_ in entries)
+		for _,size,path in sorted(entries):
+			if(total <= self.max_bytes):
+				break
+			if(path == keep):
+				continue
+			try:
+				os.remove(path)
+			except FileNotFoundError:
+				pass
+			total -= size
+
+	def clear(self):
+		for name in os.listdir(self.path):
+			if(name.endswith(".npy")):
+				os.remove(os.path.join(self.path,name))
@@ -0,0 +1,70 @@
+import numpy as np
+from utils.Utils import Utils
+
+"""
+Description:
+	Bound-based assignment (Hamerly style) for SKMeans. For every record x it keeps an upper bound of
+	the distance sum_z |U[x][label][z]| to its centroid and a lower bound of the distance to every other
+	centroid. When the centroids move, U[x][y] + S[y] changes the distance to centroid y by at most
+	sum_z |S[y][z]| (the shift norm), so the upper bound grows by the shift norm of the label and the
+	lower bound shrinks by the largest shift norm. A record whose upper bound stays strictly below its
+	lower bound keeps its label; only the other records are reassigned, from the exact distances.
+	Both bounds are also widened by the rounding error of the stored U (dtype eps), so the labels are
+	always the ones of Utils.assignLabels.
+Attributes:
+	k: number of clusters
+	attributes: number of attributes of U used
+	tile_size: records reassigned at once
+	labels, upper, lower: label and bounds of every record
+	recomputed: records reassigned in the last call
+"""
+class AssignmentBounds(object):
+	def __init__(self,**kwargs):
+		self.k          = kwargs.get("k")
+		self.attributes = kwargs.get("attributes")
+		self.tile_size  = kwargs.get("tile_size",1024)
+		self.labels     = None
+		self.upper      = None
+		self.lower      = None
+		self.recomputed = 0
+
+	"""
+	description: Labels and exact bounds of the records rows, from the distances to all the centroids
+	"""
+	def __reassign(self,U,rows):
+		for start in range(0,len(rows),self.tile_size):
+			index  = rows[start:start + self.tile_size]
+			sim    = Utils.l1Norms(np.asarray(U[index])[:,:self.k], self.attributes)
+			labels = np.argmin(sim,axis = 1)
+			inside = np.arange(len(index))
+			self.labels[index] = labels
+			self.upper[index]  = sim[inside,labels]
+			sim[inside,labels] = np.inf
+			self.lower[index]  = sim.min(axis = 1)
+
+	"""
+	description: Labels of all the records of U
+	attributes:
+		UDM: U1 of Utils.shiftUDM (n x k x a)
+		shift_matrix: plaintext shift matrix added to U since the last call, None to reassign every record
+	return: int32 array with the labels
+	"""
+	def assign(self,**kwargs):
+		U = kwargs.get("UDM")
+		S = kwargs.get("shift_matrix")
+		n = len(U)
+		a = self.attributes
+		if(self.labels is None or S is None):
+			self.labels = np.zeros(n,dtype=np.int32)
+			self.upper  = np.zeros(n)
+			self.lower  = np.zeros(n)
+			rows        = np.arange(n)
+		else:
+			shift       = Utils.l1Norms(np.asarray(S,dtype=np.float64)[None,:,:a], a)[0] #sum_z |S[y][z]|
+			slack       = (a + 2) * np.finfo(np.asarray(U).dtype).eps * (np.abs(self.upper) + np.abs(self.lower) + shift.max())
+			self.upper += shift[self.labels] + slack
+			self.lower -= shift.max() + slack
+			rows        = np.flatnonzero(self.upper >= self.lower)
+		self.__reassign(U,rows)
+		self.recomputed = len(rows)
+		return self.labels
@@ -0,0 +1,126 @@
+import numpy as np
+
+"""
+Description:
+	Condensed storage of a square (n x n x ...) matrix that is symmetric (EDM, U[y][x] = U[x][y])
+	or antisymmetric (UDM, U[y][x] = -U[x][y]). Only the lower triangle, diagonal included, is kept:
+	n(n+1)/2 entries stored row after row, the entry (x, y) with y <= x lives at x(x+1)/2 + y.
+Attributes:
+	n: number of records
+	symmetric: True for an EDM, False (default) for an antisymmetric UDM
+	data: array of shape (n(n+1)/2, ...) with the lower triangle
+Notes:
+	U[x] is a view of the stored part of row x (columns 0..x), so the U[x][y][z] reads with y <= x
+	that the clustering algorithms perform work without expanding the matrix. The other half is
+	reached through gather / rowBlock / columnBlock, which apply the (anti)symmetry.
+"""
+class CondensedMatrix(object):
+	def __init__(self,**kwargs):
+		self.n         = kwargs.get("n",0)
+		self.symmetric = kwargs.get("symmetric",False)
+		data           = kwargs.get("data")
+		if(data is None):
+			trailing_shape = tuple(kwargs.get("trailing_shape",()))
+			data           = np.zeros((self.n * (self.n + 1) // 2,) + trailing_shape,dtype=kwargs.get("dtype",np.float64))
+		self.data = data
+		if(len(self.data) != self.n * (self.n + 1) // 2):
+			raise ValueError("A condensed matrix of {} records needs {} entries, got {}".format(self.n,self.n * (self.n + 1) // 2,len(self.data)))
+
+	"""
+	description: Builds the condensed form from the lower triangle of a dense matrix
+	attributes:
+		matrix: dense (n x n x ...) matrix
+		symmetric: True for an EDM, False for an antisymmetric UDM
+	"""
+	def fromDense(**kwargs):
+		matrix = np.asarray(kwargs.get("matrix"))
+		n      = matrix.shape[0]
+		X,Y    = np.tril_indices(n)
+		return CondensedMatrix(
+			n         = n,
+			symmetric = kwargs.get("symmetric",False),
+			data      = np.ascontiguousarray(matrix[X,Y])
+		)
+
+	@property
+	def shape(self):
+		return (self.n,self.n) + self.data.shape[1:]
+
+	@property
+	def dtype(self):
+		return self.data.dtype
+
+	@property
+	def nbytes(self):
+		return self.data.nbytes
+
+	def __len__(self):
+		return self.n
+
+	def offset(self,x):
+		return x * (x + 1) // 2
+
+	"""
+	description: Stored part of row x (columns 0..x) as a view of data
+	"""
+	def __getitem__(self,x):
+		if(not isinstance(x,(int,np.integer))):
+			raise TypeError("Rows of a condensed matrix are indexed by an integer, use gather for blocks")
+		x = x + self.n if(x < 0) else x
+		if(not 0 <= x < self.n):
+			raise IndexError("Row {} is out of bounds for {} records".format(x,self.n))
+		start = self.offset(x)
+		return self.data[start:start + x + 1]
+
+	def __iter__(self):
+		for x in range(self.n):
+			yield self[x]
+
+	def astype(self,dtype):
+		if(self.data.dtype == np.dtype(dtype)):
+			return self
+		return CondensedMatrix(n = self.n, symmetric = self.symmetric, data = self.data.astype(dtype))
+
+	"""
+	description: Value of the entry (x, y) for any x, y
+	"""
+	def get(self,x,y):
+		if(y <= x):
+			return self.data[self.offset(x) + y]
+		value = self.data[self.offset(y) + x]
+		return value if(self.symmetric) else -value
+
+	"""
+	description: Dense block U[rows][:, columns] gathered in one vectorized pass
+	attributes:
+		rows: record indexes of the block rows
+		columns: record indexes of the block columns
+	return: array of shape (len(rows), len(columns), ...)
+	"""
+	def gather(self,**kwargs):
+		rows    = np.asarray(kwargs.get("rows"),dtype=np.int64)[:,None]
+		columns = np.asarray(kwargs.get("columns"),dtype=np.int64)[None,:]
+		lower   = rows >= columns
+		index   = np.where(lower, rows * (rows + 1) // 2 + columns, columns * (columns + 1) // 2 + rows)
+		block   = self.data[index]
+		if(not self.symmetric):
+			np.negative(block, out = block, where = (~lower).reshape(lower.shape + (1,) * (block.ndim - 2)))
+		return block
+
+	"""
+	description: Dense rows [start, stop) against the first columns records (all of them by default)
+	"""
+	def rowBlock(self,**kwargs):
+		start   = kwargs.get("start",0)
+		stop    = kwargs.get("stop",self.n)
+		columns = kwargs.get("columns",self.n)
+		return self.gather(rows = np.arange(start,stop), columns = np.arange(columns))
+
+	"""
+	description: Dense n x columns slice, e.g. the n x k x a UDM slice read by SKMEANS
+	"""
+	def columnBlock(self,**kwargs):
+		return self.rowBlock(columns = kwargs.get("columns",self.n))
+
+	def toDense(self):
+		return self.rowBlock()
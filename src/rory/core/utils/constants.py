@@ -10,4 +10,14 @@ class Constants(object):
         SKMEANS   = "SKMEANS"
         DBSKMEANS = "DBSKMEANS"
         KMEANS    = "KMEANS"
-        DBSNNC    = "DBSNNC"
\ No newline at end of file
+        DBSNNC    = "DBSNNC"
+
+    class UDMMode(object):
+        FULL      = "FULL"      # n x n x a
+        KCOLUMNS  = "KCOLUMNS"  # n x k x a, only the distances to the k initial seed records
+        CONDENSED = "CONDENSED" # lower triangle only, n(n+1)/2 x a for the UDM, n(n+1)/2 for the EDM (CondensedMatrix)
+
+    class Seeding(object):
+        FIRST    = "FIRST"    # the first k records
+        FARTHEST = "FARTHEST" # farthest-first traversal over the UDM L1 norms
+        KMEANSPP = "KMEANS++" # k-means++ (D^2 sampling) over the UDM L1 norms
@@ -7,23 +7,32 @@ import time
 
 path_root      = Path(__file__).parent.absolute()
 (path_root, _) = os.path.split(path_root)
-sys.path.append(str(path_root))
+sys.path.append(os.path.join(str(path_root),"src","rory","core"))
 # ______________________________________________________
 import numpy as np
 import pandas as pd
 from concurrent.futures import ThreadPoolExecutor,wait
 import unittest
 
-from clustering.secure.skmeans import SKMeans
-from clustering.secure.dbskmeans import Dbskmeans
-from clustering.secure.dbsnnc import Dbsnnc
+from clustering.secure.local.skmeans import SKMeans
+from clustering.secure.local.dbskmeans import Dbskmeans
+from clustering.secure.local.dbsnnc import Dbsnnc
+from clustering.secure.distributed.skmeans import SKMeans as DistributedSKMeans
+from clustering.secure.distributed.dbskmeans import DBSKMeans as DistributedDBSKMeans
 
 from security.cryptosystem.liu import Liu
 from security.dataowner import DataOwner
+from security.hash.fingerprint import Fingerprint
 from security.cryptosystem.FDHOpe import Fdhope
+from security.cryptosystem.fdhopesketch import FdhopeSketch
 
 from utils.Utils import Utils
 from utils.constants import Constants
+from utils.condensedmatrix import CondensedMatrix
+from utils.artifactcache import ArtifactCache
+import stat
+import tempfile
+from unittest import mock
 
 liu        = Liu(round = True)        
 m          = 3
@@ -41,7 +50,31 @@ D = [[-3,3],[-2,3],[-3,2],[-2,2],
     [-3,-2],[-3,-3],[-2,-3],[-2,-2],
     [2,-3],[3,-3],[2,-2],[3,-2]]
 
-Data1 = pd.read_csv("D:/scs/testing/data1.csv" ,header=None).values
+"""
+description: Small dataset of k gaussian blobs, fixed by seed
+"""
+def blobs(seed = 0, n = 40, k = 3, a = 2):
+    rng     = np.random.default_rng(seed)
+    centers = rng.normal(scale = 6, size = (k,a))
+    return np.round(centers[rng.integers(0,k,n)] + rng.normal(size = (n,a)),2)
+
+Data1 = blobs(seed = 1, n = 60)
+
+"""
+description: Scalar plaintext reference of SKMEANS: k-means with L1 assignment, seeded with the first k records
+"""
+def plainL1KMeans(D, k, max_iterations = 100):
+    D      = np.asarray(D,dtype=np.float64)
+    n, a   = D.shape
+    l1     = lambda x,c: sum(abs(D[x][z] - c[z]) for z in range(a))
+    labels = list(range(k)) + [ min(range(k), key = lambda y: l1(x,D[y])) for x in range(k,n) ]
+    for _ in range(max_iterations):
+        centroids = [ D[[x for x in range(n) if labels[x] == y]].mean(axis = 0) for y in range(k) ]
+        current   = [ min(range(k), key = lambda y: l1(x,centroids[y])) for x in range(n) ]
+        if(current == labels):
+            break
+        labels = current
+    return labels
 
 
 class TestCore(unittest.TestCase):
@@ -205,6 +238,510 @@ class TestCore(unittest.TestCase):
         print("ED",outsourced.UDM)
         print("Threshold",outsourced.encrypted_threshold)
  
+    def test_dbskmeans_converges(self):
+        for seed in range(6):
+            Data  = blobs(seed = seed)
+            dow0  = DataOwner(m = m, liu_scheme = liu)
+            outsourced = dow0.outsourcedData(plaintext_matrix = Data, algorithm = "SKMEANS", seed = seed)
+            skmeans    = SKMeans(
+                ciphertext_matrix = outsourced.encrypted_matrix,
+                UDM               = outsourced.UDM,
+                k                 = k,
+                m                 = m,
+                dataowner         = dow0
+            )
+            linear = Dbskmeans( #a linear key is exactly additive, the protocol must then give the SKMEANS labels
+                ciphertext_matrix = outsourced.encrypted_matrix,
+                UDM               = Fdhope.encrypt_array(plaintext_matrix = outsourced.UDM, messagespace = [0,1], cipherspace = [0,7]),
+                k                 = k,
+                m                 = m,
+                dataowner         = dow0,
+                messageIntervals  = [0,1],
+                cypherIntervals   = [0,7],
+                sens              = 0
+            )
+            self.assertEqual(linear.label_vector, skmeans.label_vector)
+            for sens in [0, 0.01]:
+                outsourced = dow0.outsourcedData(plaintext_matrix = Data, algorithm = "DBSKMEANS", seed = seed)
+                dbskmeans  = Dbskmeans(
+                    ciphertext_matrix = outsourced.encrypted_matrix,
+                    UDM               = outsourced.UDM,
+                    k                 = k,
+                    m                 = m,
+                    dataowner         = dow0,
+                    messageIntervals  = outsourced.messageIntervals,
+                    cypherIntervals   = outsourced.cypherIntervals,
+                    sens              = sens,
+                    max_iterations    = 50
+                )
+                self.assertLess(dbskmeans.iteration_counter, 50) #converged before the guard
+                if(sens == 0): #U1 is EU plus the encryption of the folded shifts, the approximation does not drift
+                    U    = np.asarray(outsourced.UDM)
+                    head = np.where(np.triu(np.ones((k,k),dtype=bool),1)[:,:,None], -U[:k,:k].transpose(1,0,2), U[:k,:k])
+                    EU   = np.concatenate((head,U[k:,:k]))
+                    S1   = Fdhope.encrypt_array(plaintext_matrix = dbskmeans.shift, messagespace = outsourced.messageIntervals, cipherspace = outsourced.cypherIntervals)
+                    np.testing.assert_allclose(dbskmeans.U1, EU + S1, rtol = 1e-9, atol = 1e-6)
+
+    def test_fdhope_is_not_linear(self):
+        U    = blobs(seed = 3)[:,None,:] - blobs(seed = 3)[None,:,:]
+        M, C = Fdhope.keygen(dataset = U, seed = 3)
+        E    = Fdhope.encrypt_array(plaintext_matrix = U, messagespace = M, cipherspace = C)
+        self.assertTrue(np.all(np.diff(E.ravel()[np.argsort(U,axis = None)]) >= 0)) #order preserving
+        slopes = np.diff(C) / np.diff(M)
+        self.assertGreater(slopes.max() / slopes.min(), 2) #every interval has its own random length
+        ratio  = Fdhope.encrypt_array(plaintext_matrix = np.array([1,2,7.5,100]), messagespace = M, cipherspace = C) / np.array([1,2,7.5,100])
+        self.assertGreater(np.ptp(ratio), 0.1 * ratio.mean()) #E(v) is not slope * v
+        lengths = np.diff(np.quantile(E[E > 0], np.linspace(0,1,5))) #the ciphertexts are spread over the cipher space
+        self.assertLess(lengths.max() / lengths.min(), 4)
+
+    def test_dbskmeans_max_iterations(self):
+        dow0       = DataOwner(m = m, liu_scheme = liu)
+        outsourced = dow0.outsourcedData(plaintext_matrix = blobs(seed = 4), algorithm = "DBSKMEANS", seed = 4)
+        dbskmeans  = Dbskmeans(
+            ciphertext_matrix = outsourced.encrypted_matrix,
+            UDM               = outsourced.UDM,
+            k                 = k,
+            m                 = m,
+            dataowner         = dow0,
+            messageIntervals  = outsourced.messageIntervals,
+            cypherIntervals   = outsourced.cypherIntervals,
+            max_iterations    = 1
+        )
+        self.assertEqual(dbskmeans.iteration_counter, 1)
+
+    def test_shiftUDM_folds_head_once(self):
+        Data  = blobs(seed = 2, n = 20)
+        dow0  = DataOwner(m = m, liu_scheme = liu)
+        U     = dow0.outsourcedData(plaintext_matrix = Data, algorithm = "SKMEANS").UDM
+        Cent  = Data[:k].copy()
+        U1    = None
+        for shift in np.random.default_rng(0).normal(size = (3,k,2)):
+            U1   = Utils.shiftUDM(UDM = U if(U1 is None) else U1, shift_matrix = shift, k = k, initial = U1 is None, tile_size = 7)
+            Cent = Cent - shift #S = Cent_i - Cent_j
+            np.testing.assert_allclose(U1, Data[:,None,:] - Cent[None,:,:], atol = 1e-9) #every row, the k x k head included
+
+    def test_skmeans_matches_plaintext(self):
+        for seed in range(6):
+            Data       = blobs(seed = seed)
+            dow0       = DataOwner(m = m, liu_scheme = Liu(round = False))
+            outsourced = dow0.outsourcedData(plaintext_matrix = Data, algorithm = "SKMEANS", seed = seed)
+            skmeans    = SKMeans(
+                ciphertext_matrix = outsourced.encrypted_matrix,
+                UDM               = outsourced.UDM,
+                k                 = k,
+                m                 = m,
+                dataowner         = dow0
+            )
+            self.assertEqual(skmeans.label_vector, plainL1KMeans(Data,k))
+
+    def test_distributed_skmeans_matches_local(self):
+        for seeding in [Constants.Seeding.FIRST, Constants.Seeding.KMEANSPP]:
+            Data       = blobs(seed = 3)
+            dow0       = DataOwner(m = m, liu_scheme = liu)
+            outsourced = dow0.outsourcedData(plaintext_matrix = Data, algorithm = "SKMEANS", seed = 3)
+            skmeans    = SKMeans(
+                ciphertext_matrix = outsourced.encrypted_matrix,
+                UDM               = outsourced.UDM,
+                k                 = k,
+                m                 = m,
+                dataowner         = dow0,
+                seeding           = seeding,
+                seed              = 5
+            )
+            S1,Cent_i,Cent_j,label_vector,order = DistributedSKMeans().run1( #a new worker for every call, only the returned values are passed back
+                status          = Constants.ClusteringStatus.START,
+                k               = k,
+                m               = m,
+                encryptedMatrix = outsourced.encrypted_matrix,
+                UDM             = outsourced.UDM,
+                seeding         = seeding,
+                seed            = 5
+            )
+            self.assertEqual(order is None, seeding == Constants.Seeding.FIRST)
+            U      = outsourced.UDM
+            status = Constants.ClusteringStatus.START
+            for _ in range(100):
+                S = np.asarray(dow0.userActions(shift_matrix = S1, m = m))
+                U = DistributedSKMeans().run_2(initial = status == Constants.ClusteringStatus.START, k = k, UDM = U, attributes = Data.shape[1], shiftMatrix = S, order = order)
+                if(Utils.verifyZero(S)):
+                    break
+                status = Constants.ClusteringStatus.WORK_IN_PROGRESS
+                S1,Cent_i,Cent_j,label_vector,order = DistributedSKMeans().run1(
+                    status          = status,
+                    k               = k,
+                    m               = m,
+                    encryptedMatrix = outsourced.encrypted_matrix,
+                    UDM             = U,
+                    Cent_j          = Cent_j,
+                    order           = order
+                )
+            self.assertTrue(Utils.verifyZero(S))
+            self.assertEqual(label_vector, skmeans.label_vector)
+            if(order is not None): #the seeded UDM rebuilt from order is the one of the seeding
+                np.testing.assert_array_equal(Utils.seededUDM(UDM = outsourced.UDM, order = order, k = k), Utils.seedPermutation(UDM = outsourced.UDM, k = k, seeding = seeding, seed = 5)[1])
+
+    def test_distributed_dbskmeans_matches_local(self):
+        Data       = blobs(seed = 2)
+        dow0       = DataOwner(m = m, liu_scheme = liu)
+        outsourced = dow0.outsourcedData(plaintext_matrix = Data, algorithm = "SKMEANS", seed = 2)
+        EU         = Fdhope.encrypt_array(plaintext_matrix = outsourced.UDM, messagespace = [0,1], cipherspace = [0,7]) #linear key, exactly additive
+        local      = Dbskmeans(ciphertext_matrix = outsourced.encrypted_matrix, UDM = EU, k = k, m = m, dataowner = dow0, messageIntervals = [0,1], cypherIntervals = [0,7], sens = 0)
+        S1,Cent_i,Cent_j,label_vector,order = DistributedDBSKMeans().run1(status = Constants.ClusteringStatus.START, k = k, m = m, encryptedMatrix = outsourced.encrypted_matrix, UDM = EU)
+        U, shift, encrypted = EU, 0, 0
+        for iteration in range(100):
+            S         = np.asarray(dow0.userActions(shift_matrix = S1, m = m))
+            shift     = shift + S #the client folds the shifts before the encryption
+            previous, encrypted = encrypted, Fdhope.encrypt_array(plaintext_matrix = shift, messagespace = [0,1], cipherspace = [0,7])
+            U         = DistributedDBSKMeans().run_2(initial = iteration == 0, k = k, UDM = U, attributes = Data.shape[1], shiftMatrix = encrypted - previous, order = order)
+            if(Utils.verifyZero(S)):
+                break
+            S1,Cent_i,Cent_j,label_vector,order = DistributedDBSKMeans().run1(status = Constants.ClusteringStatus.WORK_IN_PROGRESS, k = k, m = m, encryptedMatrix = outsourced.encrypted_matrix, UDM = U, Cent_j = Cent_j, order = order)
+        self.assertEqual(label_vector, local.label_vector)
+        np.testing.assert_allclose(U, local.U1)
+
+    def test_run_2_initial(self):
+        Data = blobs(seed = 2, n = 20)
+        U    = DataOwner(m = m, liu_scheme = liu).outsourcedData(plaintext_matrix = Data, algorithm = "SKMEANS").UDM
+        S    = np.random.default_rng(2).normal(size = (k,2))
+        for worker in [DistributedSKMeans(), DistributedDBSKMeans()]:
+            with self.assertRaises(ValueError): #no default, it used to fold the head again
+                worker.run_2(k = k, UDM = U, attributes = 2, shiftMatrix = S)
+            with self.assertRaises(ValueError): #the raw n x n x a UDM is not a U1
+                worker.run_2(initial = False, k = k, UDM = U, attributes = 2, shiftMatrix = S)
+            U1    = worker.run_2(initial = True, k = k, UDM = U, attributes = 2, shiftMatrix = S)
+            saved = U1.copy()
+            U2    = worker.run_2(initial = False, k = k, UDM = U1, attributes = 2, shiftMatrix = S)
+            np.testing.assert_array_equal(U1, saved) #the caller's U1 is copied
+            np.testing.assert_allclose(U2, Data[:,None,:] - Data[None,:k,:] + 2 * S, atol = 1e-9)
+            U3    = worker.run_2(initial = False, k = k, UDM = U1, attributes = 2, shiftMatrix = S, out = U1)
+            self.assertIs(U3, U1) #in place on request
+            np.testing.assert_allclose(U1, U2)
+
+    def test_encrypt_U_encrypts_the_lower_triangle(self):
+        Data    = blobs(seed = 8, n = 20)
+        n, a    = Data.shape
+        encrypt = Fdhope.encrypt_array
+        for algorithm in ["DBSKMEANS", "DBSNNC"]:
+            sizes = []
+            def counted(**kwargs):
+                sizes.append(np.size(kwargs.get("plaintext_matrix")))
+                return encrypt(**kwargs)
+            dow0 = DataOwner(m = m, liu_scheme = liu)
+            with mock.patch.object(Fdhope, "encrypt_array", side_effect = counted):
+                outsourced = dow0.outsourcedData(plaintext_matrix = Data, algorithm = algorithm, threshold = 1, block_size = 7, seed = 8)
+            U     = np.asarray(outsourced.UDM)
+            lower = np.tri(n,dtype=bool)
+            self.assertEqual(sum(sizes), np.count_nonzero(lower) * U[0,0].size + (algorithm == "DBSNNC")) #+1 for the threshold
+            np.testing.assert_array_equal(U, np.where(lower.reshape((n,n) + (1,) * (U.ndim - 2)), U, np.swapaxes(U,0,1))) #upper = mirrored lower
+            if(algorithm == "DBSNNC"): #deterministic, the lower triangle is the encrypted EDM
+                ED = np.abs(Data[:,None,:] - Data[None,:,:]).sum(axis = 2)
+                np.testing.assert_allclose(U[lower], encrypt(plaintext_matrix = ED[lower], messagespace = outsourced.messageIntervals, cipherspace = outsourced.cypherIntervals))
+
+    def test_multiply_tensor(self):
+        rng = np.random.default_rng(4)
+        A   = rng.integers(-50, 50, size = (6,1)).astype(np.float64)
+        B   = rng.integers(-50, 50, size = (1,5)).astype(np.float64)
+        EA  = liu.encryptTensor(plaintext_matrix = A, secret_key = sk, m = m, rng = rng)
+        EB  = liu.encryptTensor(plaintext_matrix = B, secret_key = sk, m = m, rng = rng)
+        E3  = Liu.multiplyTensor(ciphertext_1 = EA, ciphertext_2 = EB) #(6,1,m) x (1,5,m) broadcast to (6,5,m*m)
+        self.assertEqual(E3.shape, (6,5,m*m))
+        np.testing.assert_array_equal(E3[2,3], np.outer(EA[2,0], EB[0,3]).ravel()) #E3[i*m + j] = E1[i] * E2[j]
+        np.testing.assert_allclose(liu.decryptMultiplyTensor(ciphertext_matrix = E3, secret_key = sk, m = m, round = False), A * B, atol = 1e-6)
+        np.testing.assert_array_equal(liu.decryptMultiplyTensor(ciphertext_matrix = E3, secret_key = sk, m = m, round = True), A * B)
+        with self.assertRaises(ValueError):
+            Liu.multiplyTensor(ciphertext_1 = EA, ciphertext_2 = E3)
+        E   = Liu.multiply(ciphertext_1 = EA[2,0].tolist(), ciphertext_2 = EB[0,3].tolist())
+        self.assertEqual(liu.decrypt_multiply(ciphertext = E, secret_key = sk, m = m, round = True), A[2,0] * B[0,3]) #rounded once, at the end
+        groups = [ liu.decryptScalar(ciphertext = E[i*m:(i + 1)*m], secret_key = sk, m = m, round = False) for i in range(m) ] #scalar chain
+        self.assertAlmostEqual(liu.decrypt_multiply(ciphertext = E, secret_key = sk, m = m, round = False), liu.decryptScalar(ciphertext = groups, secret_key = sk, m = m, round = False), places = 6)
+
+    def test_encrypt_file(self):
+        Data = np.random.default_rng(7).integers(-100, 100, size = (23,3))
+        dow0 = DataOwner(m = m, liu_scheme = liu)
+        with tempfile.TemporaryDirectory() as directory:
+            npy, csv = os.path.join(directory,"D.npy"), os.path.join(directory,"D.csv")
+            np.save(npy, Data)
+            np.savetxt(csv, Data, delimiter = ",", header = "a,b,c", comments = "", fmt = "%d")
+            for dtype in [np.float64, np.float32]:
+                expected = np.asarray(dow0.outsourcedData(plaintext_matrix = Data, algorithm = "SKMEANS", seed = 3, chunk_size = 7, dtype = dtype).encrypted_matrix)
+                fromNpy  = dow0.encrypt_file(source_path = npy, destination_path = os.path.join(directory,"E1.npy"), chunk_size = 7, seed = 3, dtype = dtype)
+                self.assertTrue(fromNpy.round) #integer .npy source
+                fromCsv  = dow0.encrypt_file(source_path = csv, destination_path = os.path.join(directory,"E2.npy"), chunk_size = 7, seed = 3, dtype = dtype, skip_header = 1)
+                self.assertFalse(fromCsv.round)
+                for result in [fromNpy, fromCsv]: #the chunks use the streams of outsourcedData
+                    self.assertEqual(result.matrix.dtype, dtype)
+                    np.testing.assert_array_equal(result.matrix, expected)
+                    np.testing.assert_array_equal(np.load(result.matrix.filename), expected)
+                if(dtype == np.float64):
+                    np.testing.assert_array_equal(liu.decryptTensor(ciphertext_matrix = fromNpy.matrix, secret_key = dow0.sk, m = m, round = True), Data)
+                del fromNpy, fromCsv
+
+    def test_memmap_udm_matches_in_memory(self):
+        Data = blobs(seed = 4, n = 45)
+        dow0 = DataOwner(m = m, liu_scheme = liu)
+        with tempfile.TemporaryDirectory() as directory:
+            for udm_mode in [Constants.UDMMode.FULL, Constants.UDMMode.CONDENSED]:
+                inMemory = dow0.outsourcedData(plaintext_matrix = Data, algorithm = "SKMEANS", seed = 4, udm_mode = udm_mode)
+                onDisk   = dow0.outsourcedData(plaintext_matrix = Data, algorithm = "SKMEANS", seed = 4, udm_mode = udm_mode, block_size = 8, udm_path = os.path.join(directory,"U{}.npy".format(udm_mode)))
+                stored   = onDisk.UDM.data if(udm_mode == Constants.UDMMode.CONDENSED) else onDisk.UDM
+                self.assertIsInstance(stored, np.memmap)
+                expected = SKMeans(ciphertext_matrix = inMemory.encrypted_matrix, UDM = inMemory.UDM, k = k, m = m, dataowner = dow0)
+                for tile_size in [7, 45, 100]: #7 does not divide n
+                    for pruning in [False, True]:
+                        tiled = SKMeans(ciphertext_matrix = onDisk.encrypted_matrix, UDM = onDisk.UDM, k = k, m = m, dataowner = dow0, tile_size = tile_size, pruning = pruning)
+                        self.assertEqual(tiled.label_vector, expected.label_vector)
+                        np.testing.assert_array_equal(tiled.Cent_j, expected.Cent_j)
+                with self.assertRaises(ValueError): #a float64 memmap is not copied into memory as float32
+                    SKMeans(ciphertext_matrix = onDisk.encrypted_matrix, UDM = onDisk.UDM, k = k, m = m, dataowner = dow0, dtype = np.float32)
+                del stored, onDisk
+        tiles = list(Utils.iterRowTiles(matrix = np.arange(45 * 3).reshape((45,3)), start = 2, tile_size = 7)) #prefetched tiles in order
+        self.assertEqual([ (i,j) for i,j,_ in tiles ], [ (i, min(i + 7,45)) for i in range(2,45,7) ])
+        np.testing.assert_array_equal(np.concatenate([ tile for _,_,tile in tiles ]), np.arange(45 * 3).reshape((45,3))[2:])
+
+    def test_fdhope_sketch(self):
+        rng    = np.random.default_rng(11)
+        blocks = [ rng.exponential(scale, size = (50,4)) * rng.choice([-1,1], size = (50,4)) for scale in [0.5, 3, 40, 2, 700] ] #the range grows
+        values = np.abs(np.concatenate([ block.ravel() for block in blocks ]))
+        single = FdhopeSketch(bins = 512)
+        for block in blocks:
+            single.update(block)
+        single.update(np.array([np.nan, np.inf]))
+        self.assertEqual(single.count, values.size)
+        self.assertEqual(single.maximum, values.max())
+        q = np.linspace(0,1,21)
+        np.testing.assert_array_less(np.abs(single.quantile(q) - np.quantile(values,q)), single.upper / single.bins + 1e-9) #within one bin
+        merged = FdhopeSketch(bins = 512)
+        for block in blocks[::-1]: #one sketch per block, merged in another order
+            merged.merge(FdhopeSketch(bins = 512).update(block))
+        self.assertEqual((merged.upper, merged.count, merged.maximum), (single.upper, single.count, single.maximum))
+        np.testing.assert_array_equal(merged.counts, single.counts)
+        np.testing.assert_array_equal(merged.quantile(q), single.quantile(q))
+        with self.assertRaises(ValueError):
+            single.merge(FdhopeSketch(bins = 256).update(blocks[0]))
+        np.testing.assert_array_equal(FdhopeSketch().quantile(q), np.zeros(q.shape))
+        keys = [ Fdhope.keygen(sketch = single, seed = 1), Fdhope.keygen(dataset = np.concatenate(blocks), bins = 512, block_size = 13, seed = 1) ]
+        np.testing.assert_array_equal(keys[0][0], keys[1][0])
+        np.testing.assert_array_equal(keys[0][1], keys[1][1])
+
+    def test_pipeline_matches_sequential(self):
+        Data = blobs(seed = 12, n = 30)
+        dow0 = DataOwner(m = m, liu_scheme = liu)
+        for algorithm in ["SKMEANS", "DBSKMEANS", "DBSNNC"]:
+            sequential = dow0.outsourcedData(plaintext_matrix = Data, algorithm = algorithm, threshold = 2, seed = 12, workers = 2)
+            pipelined  = dow0.outsourcedData(plaintext_matrix = Data, algorithm = algorithm, threshold = 2, seed = 12, workers = 2, pipeline = True)
+            np.testing.assert_array_equal(pipelined.encrypted_matrix, sequential.encrypted_matrix)
+            np.testing.assert_array_equal(pipelined.UDM, sequential.UDM)
+            np.testing.assert_array_equal(pipelined.messageIntervals, sequential.messageIntervals)
+            np.testing.assert_array_equal(pipelined.cypherIntervals, sequential.cypherIntervals)
+            self.assertEqual(pipelined.encrypted_threshold, sequential.encrypted_threshold)
+            stages = {"encryption", "udm"} if(algorithm == "SKMEANS") else {"encryption", "udm", "keygen", "fdhope"}
+            for result in [sequential, pipelined]:
+                self.assertEqual(set(result.stage_times), stages)
+                self.assertTrue(all(t >= 0 for t in result.stage_times.values()))
+                self.assertEqual(result.stage_times["encryption"], result.encrypted_matrix_time)
+                self.assertEqual(result.critical_path_time, max(result.encrypted_matrix_time, result.udm_time))
+                self.assertLessEqual(sum(result.stage_times[stage] for stage in stages - {"encryption"}), result.udm_time) #the U chain runs inside udm_time
+                self.assertLessEqual(result.critical_path_time, result.total_time)
+            self.assertLessEqual(sequential.encrypted_matrix_time + sequential.udm_time, sequential.total_time)
+
+    def test_fingerprint(self):
+        X           = np.random.default_rng(13).normal(size = (40,6,3))
+        wide        = np.random.default_rng(14).normal(size = (40,12,3))
+        wide[:,::2] = X #wide[:,::2] is a non-contiguous view of the values of X
+        for leaf_size in [2**24, 100, 7]: #one leaf, and leaves that split rows and values
+            digest = lambda x, **kwargs: Fingerprint.matrix(matrix = x, leaf_size = leaf_size, **kwargs)
+            same   = [X.copy(order = "C"), np.asfortranarray(X), wide[:,::2], wide[:,::2].copy(order = "F"), X.tolist()]
+            self.assertFalse(same[2].flags.c_contiguous)
+            for x in same:
+                self.assertEqual(digest(x), digest(X))
+                self.assertEqual(digest(x, workers = 4), digest(X))
+            different = [X + np.eye(1,X.size).reshape(X.shape) * 1e-12, X.reshape((40,18)), X.astype(np.float32), X[:-1], np.swapaxes(X,0,1)]
+            for x in different:
+                self.assertNotEqual(digest(x), digest(X))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory,"X.npy")
+            np.save(path, X)
+            self.assertTrue(Fingerprint.equals(np.load(path, mmap_mode = "r"), X, leaf_size = 64, workers = 3))
+        U = CondensedMatrix.fromDense(matrix = X[:4,:4] - np.swapaxes(X[:4,:4],0,1))
+        self.assertNotEqual(Fingerprint.matrix(matrix = U), Fingerprint.matrix(matrix = U.data)) #the condensed layout is part of the key
+        self.assertEqual(Fingerprint.matrix(matrix = np.zeros((0,3))), Fingerprint.matrix(matrix = np.zeros((0,3)), workers = 2))
+        self.assertNotEqual(Fingerprint.matrix(matrix = np.zeros((0,3))), Fingerprint.matrix(matrix = np.zeros((3,0))))
+
+    def test_concurrent_engines_are_deterministic(self):
+        scheme = Liu(round = False) #one scheme, one key and one data owner shared by every thread
+        key    = scheme.secretKey(m = m)
+        Data   = blobs(seed = 15, n = 40)
+        dow0   = DataOwner(m = m, liu_scheme = scheme)
+        outsourced = dow0.outsourcedData(plaintext_matrix = Data, algorithm = "SKMEANS", seed = 15)
+
+        def task(i):
+            E = scheme.encryptMatrix(plaintext_matrix = Data + i, secret_key = key, m = m, seed = i, chunk_size = 9).matrix
+            V = scheme.decryptMatrix(ciphertext_matrix = E, secret_key = key, m = m, round = False).matrix
+            P = scheme.decryptMultiplyTensor(ciphertext_matrix = Liu.multiplyTensor(ciphertext_1 = E, ciphertext_2 = E), secret_key = key, m = m, round = False)
+            labels = SKMeans(ciphertext_matrix = outsourced.encrypted_matrix, UDM = outsourced.UDM, k = k, m = m, dataowner = dow0).label_vector
+            return E, V, P, labels
+
+        serial = [ task(i % 4) for i in range(4) ]
+        with ThreadPoolExecutor(max_workers = 8) as executor:
+            results = list(executor.map(task, [ i % 4 for i in range(32) ]))
+        for i,(E,V,P,labels) in enumerate(results):
+            expected = serial[i % 4]
+            np.testing.assert_array_equal(E, expected[0])
+            np.testing.assert_array_equal(V, expected[1])
+            np.testing.assert_array_equal(P, expected[2])
+            self.assertEqual(labels, expected[3])
+            np.testing.assert_allclose(V, Data + i % 4, atol = 1e-6)
+
+    def test_populateClusters_matches_scalar(self):
+        Data       = blobs(seed = 5, n = 50)
+        dow0       = DataOwner(m = m, liu_scheme = liu)
+        outsourced = dow0.outsourcedData(plaintext_matrix = Data, algorithm = "SKMEANS", seed = 5)
+        U          = np.asarray(outsourced.UDM)
+        D1         = np.asarray(outsourced.encrypted_matrix)
+        n, a       = Data.shape
+        expected   = [] #scalar loop of the records k..n-1
+        for x in range(k,n):
+            sims = [ sum(abs(U[x][y][z]) for z in range(a)) for y in range(k) ]
+            expected.append(sims.index(min(sims)))
+        for UDM in [U, CondensedMatrix.fromDense(matrix = U), np.ascontiguousarray(U[:,:k])]:
+            C, label_vector = Utils.populateClusters(record_id = k, UDM = UDM, k = k, tile_size = 7)
+            self.assertEqual(label_vector, expected)
+            for y in range(k): #seed y first, then its members in record order
+                self.assertEqual(C[y].tolist(), [y] + [ x for x in range(k,n) if expected[x - k] == y ])
+        C, _ = Utils.populateClusters(record_id = k, UDM = U, k = k, ciphertext_matrix = D1, ciphertexts = True)
+        for y in range(k):
+            np.testing.assert_array_equal(C[y], D1[[y] + [ x for x in range(k,n) if expected[x - k] == y ]])
+
+    def test_centroids_match_liu_chain(self):
+        Data       = blobs(seed = 6, n = 30)
+        dow0       = DataOwner(m = m, liu_scheme = liu)
+        D1         = np.asarray(dow0.outsourcedData(plaintext_matrix = Data, algorithm = "SKMEANS", seed = 6).encrypted_matrix)
+        n, a       = Data.shape
+        clusters   = 4
+        labels     = np.random.default_rng(6).integers(0,clusters - 1,n).tolist() #the last cluster stays empty
+        expected   = [] #scalar chain of Liu.add and Liu.multiply_c, in record order
+        for y in range(clusters):
+            members = [ D1[x].tolist() for x in range(n) if labels[x] == y ]
+            average = np.zeros((a,m)).tolist()
+            for record in members:
+                for q in range(a):
+                    average[q] = Liu.add(ciphertext_1 = average[q], ciphertext_2 = record[q])
+            expected.append([ Liu.multiply_c(scalar = 1/len(members), ciphertext_1 = average[q]) for q in range(a) ] if(members) else np.zeros((a,m)).tolist())
+        centroids = Utils.calculateCentroids(ciphertext_matrix = D1, label_vector = labels, k = clusters, attributes = a, m = m)
+        self.assertEqual(centroids, expected) #bit-identical
+        C = [ D1[[x for x in range(n) if labels[x] == y]] for y in range(clusters) ]
+        self.assertEqual(Utils.calculateCentroids(clusters = C, k = clusters, attributes = a, m = m), expected)
+
+    def test_pruning_keeps_labels(self):
+        for seed in range(4):
+            Data       = blobs(seed = seed, n = 200, k = 4, a = 3)
+            if(seed == 3):
+                Data = np.round(Data) #ties
+            dow0       = DataOwner(m = m, liu_scheme = Liu(round = False))
+            outsourced = dow0.outsourcedData(plaintext_matrix = Data, algorithm = "SKMEANS", seed = seed)
+            for dtype in [np.float64, np.float32]:
+                results = [ SKMeans(
+                    ciphertext_matrix = outsourced.encrypted_matrix,
+                    UDM               = outsourced.UDM,
+                    k                 = 4,
+                    m                 = m,
+                    dataowner         = dow0,
+                    dtype             = dtype,
+                    pruning           = pruning
+                ) for pruning in [False, True] ]
+                self.assertEqual(results[1].label_vector, results[0].label_vector)
+                self.assertEqual(results[1].iteration_counter, results[0].iteration_counter)
+                np.testing.assert_array_equal(results[1].Cent_j, results[0].Cent_j)
+                if(results[1].iteration_counter > 1): #the last assignment skipped records
+                    self.assertLess(results[1].bounds.recomputed, len(Data))
+                if(dtype == np.float64 and seed < 3):
+                    self.assertEqual(results[1].label_vector, plainL1KMeans(Data,4))
+
+    def test_append_records_matches_full_recompute(self):
+        Data  = blobs(seed = 7, n = 30)
+        New   = blobs(seed = 8, n = 9)
+        Full  = np.concatenate((Data,New))
+        cases = [
+            ("SKMEANS", Constants.UDMMode.FULL),
+            ("SKMEANS", Constants.UDMMode.KCOLUMNS),
+            ("SKMEANS", Constants.UDMMode.CONDENSED),
+            ("DBSNNC",  Constants.UDMMode.FULL),
+            ("DBSNNC",  Constants.UDMMode.CONDENSED),
+        ]
+        for algorithm, udm_mode in cases:
+            dow0       = DataOwner(m = m, liu_scheme = Liu(round = False))
+            outsourced = dow0.outsourcedData(plaintext_matrix = Data, algorithm = algorithm, udm_mode = udm_mode, k = k, threshold = 2, seed = 7, incremental = True)
+            delta      = dow0.append_records(plaintext_matrix = New, seed = 8)
+            UDM, D1    = Utils.mergeDelta(UDM = outsourced.UDM, encrypted_matrix = outsourced.encrypted_matrix, delta = delta)
+            UDM        = UDM.toDense() if(isinstance(UDM,CondensedMatrix)) else np.asarray(UDM)
+            if(algorithm == "SKMEANS"): #the full recompute of the plaintext UDM
+                expected = Full[:,None,:] - Full[None,:,:]
+                expected = expected[:,:k] if(udm_mode == Constants.UDMMode.KCOLUMNS) else expected
+            else: #the full EDM, encrypted with the FDH-OPE key of the dataset (sens = 0 is deterministic)
+                expected = Fdhope.encrypt_array(
+                    plaintext_matrix = np.abs(Full[:,None,:] - Full[None,:,:]).sum(axis = 2),
+                    messagespace     = outsourced.messageIntervals,
+                    cipherspace      = outsourced.cypherIntervals
+                )
+            np.testing.assert_allclose(UDM, expected, rtol = 1e-12, atol = 1e-9, err_msg = "{} {}".format(algorithm,udm_mode))
+            np.testing.assert_array_equal(D1[:len(Data)], outsourced.encrypted_matrix)
+            np.testing.assert_allclose(liu.decryptTensor(ciphertext_matrix = D1, secret_key = dow0.sk, m = m, round = False), Full, atol = 1e-6)
+        dow0 = DataOwner(m = m, liu_scheme = Liu(round = False)) #by default the data owner keeps no plaintext
+        dow0.outsourcedData(plaintext_matrix = Data, algorithm = "SKMEANS", seed = 7)
+        self.assertIsNone(dow0.outsourced)
+        with self.assertRaises(ValueError):
+            dow0.append_records(plaintext_matrix = New, seed = 8)
+
+    def test_artifact_cache_is_private(self):
+        with self.assertRaises(ValueError):
+            ArtifactCache()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory,"cache")
+            dow0 = DataOwner(m = m, liu_scheme = liu, cache = path)
+            dow0.outsourcedData(plaintext_matrix = blobs(seed = 9, n = 10), algorithm = "DBSKMEANS", seed = 9)
+            self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o700)
+            files = os.listdir(path)
+            self.assertTrue(len(files) > 0)
+            for name in files:
+                self.assertEqual(stat.S_IMODE(os.stat(os.path.join(path,name)).st_mode), 0o600)
+
+    def test_encryptMatrix_in_process_matches_pool(self):
+        D      = blobs(seed = 3, n = 25)
+        single = liu.encryptMatrix(plaintext_matrix = D, secret_key = sk, m = m, seed = 7, chunk_size = 6).matrix
+        pooled = liu.encryptMatrix(plaintext_matrix = D, secret_key = sk, m = m, seed = 7, chunk_size = 6, workers = 2).matrix
+        self.assertIsInstance(single, np.ndarray)
+        np.testing.assert_array_equal(single, pooled)
+        np.testing.assert_allclose(liu.decryptTensor(ciphertext_matrix = single, secret_key = sk, m = m, round = False), D, atol = 1e-9)
+
+    def test_float32_rounding_range(self):
+        V = np.trunc(np.random.default_rng(5).uniform(-100, 100, size = (2000,)))
+        for seed in range(10): #when the bound allows the rounding, it is exact
+            key   = liu.secretKey(m = m)
+            E     = liu.encryptTensor(plaintext_matrix = V, secret_key = key, m = m, dtype = np.float32, rng = np.random.default_rng(seed))
+            error = liu.decryptionError(magnitude = E, secret_key = key, m = m)
+            self.assertTrue(np.all(np.abs(liu.decryptTensor(ciphertext_matrix = E, secret_key = key, m = m, round = False) - V) <= error))
+            if(error.max() < 0.005):
+                np.testing.assert_array_equal(liu.decryptTensor(ciphertext_matrix = E, secret_key = key, m = m, round = True), V)
+        key = [(1e-4,0.9,0.03),(0.5,0.9,0.02),(0.5,0.5,0.5)] #a small k_1 gives a large decryption weight
+        V   = np.arange(100)
+        E   = liu.encryptTensor(plaintext_matrix = V, secret_key = key, m = m, dtype = np.float32, rng = np.random.default_rng(0))
+        with self.assertRaises(ValueError):
+            liu.decryptTensor(ciphertext_matrix = E, secret_key = key, m = m, round = True)
+        with self.assertRaises(ValueError): #a float64 tensor computed from float32 ciphertexts
+            liu.decryptTensor(ciphertext_matrix = E.astype(np.float64), secret_key = key, m = m, round = True, dtype = np.float32, magnitude = np.abs(E))
+        np.testing.assert_allclose(liu.decryptTensor(ciphertext_matrix = E, secret_key = key, m = m, round = False), V, atol = 0.1)
+        E = liu.encryptTensor(plaintext_matrix = V, secret_key = key, m = m)
+        np.testing.assert_array_equal(liu.decryptTensor(ciphertext_matrix = E, secret_key = key, m = m, round = True), V)
+
+    def test_float32_skmeans_checks_the_shift(self):
+        Data       = np.round(blobs(seed = 2) * 10).astype(np.int64)
+        dow0       = DataOwner(m = m, liu_scheme = liu)
+        dow0.sk    = [(1e-4,0.9,0.03),(0.5,0.9,0.02),(0.5,0.5,0.5)]
+        dow0.weights = liu.decryptionWeights(secret_key = dow0.sk, m = m)
+        outsourced = dow0.outsourcedData(plaintext_matrix = Data, algorithm = "SKMEANS", dtype = np.float32, seed = 2)
+        self.assertTrue(dow0.round)
+        with self.assertRaises(ValueError): #S1 is float64 but comes from float32 ciphertexts
+            SKMeans(ciphertext_matrix = outsourced.encrypted_matrix, UDM = outsourced.UDM, k = k, m = m, dataowner = dow0, dtype = np.float32)
 
 if __name__ == '__main__':
     unittest.main()